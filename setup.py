@@ -11,6 +11,7 @@ setup(name='pyunisens',
       author='skjerns',
       license='GNU 2.0',
       packages=['unisens'],
+      entry_points={'console_scripts': ['unisens-convert=unisens.batch:main']},
       long_description=long_description,
       long_description_content_type="text/markdown",
       install_requires=[
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the batch conversion of many unisens recordings
+"""
+import os
+import shutil
+import unittest
+
+import numpy as np
+
+from unisens import Unisens, SignalEntry, convert_folders
+from unisens.batch import csv_to_bin, to_int16, main, _paths, _recover
+
+
+def fail_on_rec1(u):
+    """a conversion that fails for one recording, after it changed files"""
+    u.comment = 'converted'
+    SignalEntry('extra.csv', parent=u).set_data(np.zeros([1, 5]), sampleRate=1,
+                                                ch_names=['x'])
+    if u.measurementId == 'patient_1':
+        raise ValueError('broken recording')
+
+
+def add_comment(u):
+    u.comment = 'converted'
+
+
+class Testing(unittest.TestCase):
+    tmpdir = os.path.join(os.path.dirname(__file__), 'tmp_batch')
+
+    @classmethod
+    def setUp(cls):
+        os.makedirs(cls.tmpdir, exist_ok=True)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def create_recordings(self, n=4):
+        folders = []
+        for i in range(n):
+            folder = os.path.join(self.tmpdir, 'data', f'rec{i}')
+            u = Unisens(folder, makenew=True, measurementId=f'patient_{i}')
+            data = np.arange(20, dtype=float).reshape(2, 10) * (i + 1) - 5.5
+            SignalEntry('ecg.csv', parent=u).set_data(data, sampleRate=256, unit='mV',
+                                                      ch_names=['I', 'II'])
+            u.save()
+            folders.append(os.path.abspath(folder))
+        return folders
+
+    def test_convert_folders(self):
+        folders = self.create_recordings()
+        progress = []
+        result = convert_folders(os.path.join(self.tmpdir, 'data'), csv_to_bin,
+                                 n_workers=2, progress=lambda *args: progress.append(args))
+        self.assertEqual(sorted(result['converted']), folders)
+        self.assertEqual(result['skipped'], [])
+        self.assertEqual(result['failed'], {})
+        self.assertEqual(sorted(p[0] for p in progress), [1, 2, 3, 4])
+        self.assertTrue(all(p[1] == 4 and p[3] == 'converted' for p in progress))
+
+        for i, folder in enumerate(folders):
+            u = Unisens(folder, readonly=True)
+            self.assertEqual(len(u), 1)
+            entry = u['ecg.bin']
+            self.assertEqual(entry.unit, 'mV')
+            data = np.arange(20, dtype=float).reshape(2, 10) * (i + 1) - 5.5
+            np.testing.assert_allclose(entry.get_data(), data)
+            np.testing.assert_allclose(entry.get_data(channels='II')[0], data[1])
+            self.assertFalse(os.path.exists(os.path.join(folder, 'ecg.csv')))
+            self.assertTrue(os.path.isfile(_paths(folder, 'csv_to_bin')[0]))
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, 'data'))),
+                         ['rec0', 'rec1', 'rec2', 'rec3'])
+
+        # converted recordings are skipped
+        result = convert_folders(folders, csv_to_bin, n_workers=2)
+        self.assertEqual(result['skipped'], folders)
+        self.assertEqual(result['converted'], [])
+
+        # but can be converted again
+        result = convert_folders(folders[:1], csv_to_bin, n_workers=1, resume=False)
+        self.assertEqual(result['converted'], folders[:1])
+
+        # other jobs have their own markers
+        result = convert_folders(folders, to_int16, n_workers=1)
+        self.assertEqual(result['converted'], folders)
+        for i, folder in enumerate(folders):
+            entry = Unisens(folder, readonly=True)['ecg.bin']
+            self.assertEqual(entry.dataType, 'int16')
+            data = np.arange(20, dtype=float).reshape(2, 10) * (i + 1) - 5.5
+            np.testing.assert_allclose(entry.get_data(), data, atol=float(entry.lsbValue) / 2)
+
+    def test_failed_folder(self):
+        folders = self.create_recordings(3)
+        with open(os.path.join(folders[1], 'unisens.xml'), 'rb') as f:
+            before = f.read()
+        result = convert_folders(folders, fail_on_rec1, n_workers=2)
+        self.assertEqual(sorted(result['converted']), [folders[0], folders[2]])
+        self.assertEqual(list(result['failed']), [folders[1]])
+        self.assertIn('broken recording', result['failed'][folders[1]])
+
+        # the failed recording is unchanged and nothing is left behind
+        with open(os.path.join(folders[1], 'unisens.xml'), 'rb') as f:
+            self.assertEqual(f.read(), before)
+        self.assertEqual(sorted(os.listdir(folders[1])), ['ecg.csv', 'unisens.xml'])
+        self.assertEqual(sorted(os.listdir(os.path.join(self.tmpdir, 'data'))),
+                         ['rec0', 'rec1', 'rec2'])
+
+        # only the failed recording is converted again
+        result = convert_folders(folders, add_comment, n_workers=1, name='fail_on_rec1')
+        self.assertEqual(result['skipped'], [folders[0], folders[2]])
+        self.assertEqual(result['converted'], [folders[1]])
+        self.assertEqual(Unisens(folders[1], readonly=True).comment, 'converted')
+
+    def test_recover(self):
+        folders = self.create_recordings(3)
+        name = 'job'
+
+        # interrupted while copying: the copy is removed
+        _, staging, backup = _paths(folders[0], name)
+        shutil.copytree(folders[0], staging)
+        _recover(folders[0], name)
+        self.assertFalse(os.path.exists(staging))
+        self.assertTrue(os.path.isdir(folders[0]))
+
+        # interrupted after the original was moved away: it is restored
+        _, staging, backup = _paths(folders[1], name)
+        shutil.copytree(folders[1], staging)
+        os.rename(folders[1], backup)
+        _recover(folders[1], name)
+        self.assertFalse(os.path.exists(staging))
+        self.assertFalse(os.path.exists(backup))
+        self.assertFalse(os.path.exists(_paths(folders[1], name)[0]))
+
+        # interrupted after the conversion was complete: the conversion is kept
+        _, staging, backup = _paths(folders[2], name)
+        shutil.copytree(folders[2], staging)
+        open(_paths(staging, name)[0], 'w').close()
+        os.rename(folders[2], backup)
+        _recover(folders[2], name)
+        self.assertFalse(os.path.exists(staging))
+        self.assertFalse(os.path.exists(backup))
+        self.assertTrue(os.path.isfile(_paths(folders[2], name)[0]))
+
+    def test_recover_root(self):
+        folders = self.create_recordings(3)
+        root = os.path.join(self.tmpdir, 'data')
+
+        def interrupt(folder, name, complete):
+            """a job that stopped between the two renames of _convert_folder"""
+            _, staging, backup = _paths(folder, name)
+            shutil.copytree(folder, staging)
+            if complete:
+                open(_paths(staging, name)[0], 'w').close()
+            os.rename(folder, backup)
+
+        interrupt(folders[0], 'csv_to_bin', complete=False)
+        interrupt(folders[1], 'other_job', complete=True)
+        result = convert_folders(root, csv_to_bin, n_workers=1)
+        self.assertEqual(result['converted'], folders)
+        self.assertEqual(result['skipped'], [])
+        self.assertEqual(sorted(os.listdir(root)), ['rec0', 'rec1', 'rec2'])
+        self.assertTrue(os.path.isfile(_paths(folders[1], 'other_job')[0]))
+        for folder in folders:
+            self.assertEqual(list(Unisens(folder, readonly=True).entries), ['ecg.bin'])
+
+        interrupt(folders[2], 'job', complete=False)
+        self.assertEqual(main([root, 'test.batch_test:add_comment', '--workers', '1',
+                               '--name', 'job']), 0)
+        self.assertEqual(sorted(os.listdir(root)), ['rec0', 'rec1', 'rec2'])
+        for folder in folders:
+            self.assertEqual(Unisens(folder, readonly=True).comment, 'converted')
+
+    def test_main(self):
+        folders = self.create_recordings(2)
+        root = os.path.join(self.tmpdir, 'data')
+        self.assertEqual(main([root, 'csv2bin', '--workers', '1']), 0)
+        for folder in folders:
+            self.assertIn('ecg.bin', Unisens(folder, readonly=True))
+        self.assertEqual(main([root, 'test.batch_test:fail_on_rec1', '--workers', '1']), 1)
+        with self.assertRaises(ValueError):
+            main([root, 'unknown'])
+
+
+if __name__ == '__main__':
+    unittest.main()
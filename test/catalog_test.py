@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the catalog of many unisens recordings
+"""
+import os
+import time
+import shutil
+import unittest
+
+import numpy as np
+
+from unisens import Catalog, Unisens, SignalEntry, EventEntry, CustomAttributes
+
+
+class Testing(unittest.TestCase):
+    tmpdir = os.path.join(os.path.dirname(__file__), 'tmp_catalog')
+
+    @classmethod
+    def setUp(cls):
+        os.makedirs(cls.tmpdir, exist_ok=True)
+
+    @classmethod
+    def tearDown(cls):
+        shutil.rmtree(cls.tmpdir)
+
+    def create_recordings(self, n=5):
+        folders = []
+        for i in range(n):
+            folder = os.path.join(self.tmpdir, 'data', f'site{i % 2}', f'rec{i}')
+            u = Unisens(folder, makenew=True, measurementId=f'patient_{i}',
+                        duration=i * 1000)
+            SignalEntry('ecg.bin', parent=u, contentClass='ECG').set_data(
+                np.zeros([1, 10]), sampleRate=128 * (i + 1), ch_names=['ecg'])
+            EventEntry('events.csv', parent=u).set_data([[1, 'a']], sampleRate=1)
+            custom = CustomAttributes('age', str(20 + i))
+            u.add_entry(custom)
+            u.save()
+            folders.append(os.path.abspath(folder))
+        return folders
+
+    def test_scan(self):
+        folders = self.create_recordings()
+        with Catalog() as catalog:
+            stats = catalog.scan(os.path.join(self.tmpdir, 'data'), n_workers=2)
+            self.assertEqual(stats, {'added': 5, 'updated': 0, 'removed': 0, 'failed': 0})
+            self.assertEqual(len(catalog), 5)
+            self.assertIn(folders[0], catalog)
+
+            stats = catalog.scan(os.path.join(self.tmpdir, 'data'))
+            self.assertEqual(stats, {'added': 0, 'updated': 0, 'removed': 0, 'failed': 0})
+
+            # change, remove and break recordings
+            time.sleep(0.01)
+            u = Unisens(folders[1])
+            u.set_attrib('measurementId', 'changed')
+            u.save()
+            shutil.rmtree(folders[2])
+            with open(os.path.join(folders[3], 'unisens.xml'), 'w') as f:
+                f.write('<no xml')
+            stats = catalog.scan(os.path.join(self.tmpdir, 'data'), n_workers=1)
+            self.assertEqual(stats, {'added': 0, 'updated': 1, 'removed': 1, 'failed': 1})
+            self.assertEqual(catalog.find_recordings(measurementId='changed'),
+                             [folders[1]])
+
+            # scanning a subfolder does not remove the other recordings
+            stats = catalog.scan(os.path.join(self.tmpdir, 'data', 'site0'))
+            self.assertEqual(stats['removed'], 0)
+            self.assertEqual(len(catalog), 4)
+
+    def test_queries(self):
+        folders = self.create_recordings()
+        db_file = os.path.join(self.tmpdir, 'catalog.sqlite')
+        with Catalog(db_file) as catalog:
+            catalog.scan(self.tmpdir)
+
+        with Catalog(db_file) as catalog:
+            self.assertEqual(catalog.find_recordings(), sorted(folders))
+            self.assertEqual(catalog.find_recordings(measurementId='patient_3'),
+                             [folders[3]])
+            self.assertEqual(catalog.find_recordings(duration=(2000, None)),
+                             sorted(folders[2:]))
+            self.assertEqual(catalog.find_recordings(age='21'), [folders[1]])
+            self.assertEqual(catalog.find_recordings(age=22, duration=(0, 1000)), [])
+
+            entries = catalog.find_entries(entry_type='signalEntry', contentClass='ECG',
+                                           sampleRate=(256, 512))
+            self.assertEqual(entries, sorted([(folders[1], 'ecg.bin'),
+                                              (folders[2], 'ecg.bin'),
+                                              (folders[3], 'ecg.bin')]))
+            self.assertEqual(len(catalog.find_entries(entry_type='eventEntry')), 5)
+
+            self.assertEqual(catalog.get_attrib(folders[0])['measurementId'], 'patient_0')
+            self.assertEqual(catalog.get_attrib(folders[0], 'ecg.bin')['sampleRate'], '128')
+            self.assertEqual(catalog.get_entries(folders[0]),
+                             [('ecg.bin', 'signalEntry'), ('events.csv', 'eventEntry')])
+            with self.assertRaises(KeyError):
+                catalog.get_attrib('not_a_folder')
+
+            u = catalog.load(folders[4], readonly=True)
+            self.assertEqual(u.measurementId, 'patient_4')
+            self.assertEqual(u['ecg.bin'].get_data().shape, (1, 10))
+
+    def test_non_numeric(self):
+        folders = self.create_recordings(2)
+        for i, duration in enumerate(['abc', '', 'nan']):
+            folder = os.path.join(self.tmpdir, 'data', f'text{i}')
+            Unisens(folder, makenew=True, duration=duration).save()
+        with Catalog() as catalog:
+            catalog.scan(self.tmpdir)
+            self.assertEqual(len(catalog), 5)
+            self.assertEqual(catalog.find_recordings(duration=(None, 100)), [folders[0]])
+            self.assertEqual(catalog.find_recordings(duration=(None, None)), folders)
+            self.assertEqual(len(catalog.find_recordings(duration='abc')), 1)
+
+    def test_schema_version(self):
+        folders = self.create_recordings(1)
+        db_file = os.path.join(self.tmpdir, 'catalog.sqlite')
+        with Catalog(db_file) as catalog:
+            catalog.scan(self.tmpdir)
+            catalog._db.execute('PRAGMA user_version = 0')
+        # catalogs of older versions are created anew
+        with Catalog(db_file) as catalog:
+            self.assertEqual(len(catalog), 0)
+            catalog.scan(self.tmpdir)
+            self.assertEqual(catalog.find_recordings(duration=(0, 0)), folders)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,15 +8,19 @@ import os
 import warnings
 
 import pytest
+from unittest import mock
 
 from unisens import CustomEntry, ValuesEntry, EventEntry, SignalEntry
 from unisens import MiscEntry, CustomAttributes, Unisens, FileEntry
 from unisens import make_key
+from unisens.utils import str2num
+import unisens
 
 import unittest
 import shutil
 import numpy as np
 import pickle
+from xml.etree import ElementTree as ET
 
 
 def elements_equal(e1, e2):
@@ -190,6 +194,91 @@ class Testing(unittest.TestCase):
         u = Unisens(folder)
         self.assertEqual(len(u), 4)
 
+    def test_unisens_autosave_batch(self):
+        folder = os.path.join(self.tmpdir, 'data', 'batch')
+        u = Unisens(folder, makenew=True, autosave=True)
+        with mock.patch.object(u, 'save', wraps=u.save) as save:
+            with u.batch():
+                for i in range(20):
+                    u.set_attrib(f'attr{i}', i)
+                with u.batch():
+                    entry = SignalEntry('signal.bin', parent=u)
+                    entry.set_data(np.random.rand(2, 100), sampleRate=10)
+                self.assertEqual(save.call_count, 0)
+            self.assertEqual(save.call_count, 1)
+
+            # set_data of an entry is batched by itself
+            entry.set_data(np.random.rand(2, 100), sampleRate=10)
+            self.assertEqual(save.call_count, 2)
+            with entry.batch():
+                entry.set_attrib('unit', 'mV')
+                entry.set_attrib('comment', 'test')
+            self.assertEqual(save.call_count, 3)
+
+        u2 = Unisens(folder)
+        self.assertEqual(u2.attr19, '19')
+        self.assertEqual(u2.signal.unit, 'mV')
+        self.assertIsNotNone(CustomEntry('test.txt').batch())
+
+        # a batch that fails is not saved
+        with self.assertRaises(ValueError):
+            with u.batch():
+                u.set_attrib('comment', 'partly applied')
+                raise ValueError
+        self.assertEqual(u.comment, 'partly applied')
+        self.assertNotEqual(Unisens(folder).comment, 'partly applied')
+
+        # with an interval, changes are only saved when flushed
+        u = Unisens(folder, makenew=True, autosave=True, autosave_interval=3600)
+        u.set_attrib('key', 'value')
+        self.assertNotIn('key', Unisens(folder).attrib)
+        u.flush()
+        self.assertEqual(Unisens(folder).key, 'value')
+        with mock.patch.object(u, 'save', wraps=u.save) as save:
+            u.flush()
+            self.assertEqual(save.call_count, 0)
+
+        # pending changes are flushed when Python exits
+        with mock.patch('atexit.register') as register:
+            u = Unisens(folder, autosave=True, autosave_interval=3600)
+        u.set_attrib('key', 'at exit')
+        self.assertEqual(Unisens(folder).key, 'value')
+        func, ref = register.call_args[0]
+        func(ref)
+        self.assertEqual(Unisens(folder).key, 'at exit')
+
+    def test_save_atomic(self):
+        folder = os.path.join(self.tmpdir, 'atomic')
+        u = Unisens(folder, makenew=True)
+        u.set_attrib('key', 'value1')
+        u.save()
+        file = os.path.join(folder, 'unisens.xml')
+        with open(file, 'rb') as f:
+            content = f.read()
+        self.assertTrue(content.startswith(b"<?xml version='1.0' encoding='utf-8'?>"))
+
+        # unchanged content is not written again
+        with mock.patch('unisens.main.write_atomic') as write:
+            u.save()
+            self.assertEqual(write.call_count, 0)
+        # but it is written if the file was changed by someone else
+        os.remove(file)
+        u.save()
+        self.assertTrue(os.path.isfile(file))
+
+        # a failed write leaves the previous file intact
+        u.set_attrib('key', 'value2')
+        with mock.patch('os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                u.save()
+        self.assertEqual(Unisens(folder).key, 'value1')
+        self.assertEqual(os.listdir(folder), ['unisens.xml'])
+
+        u.save(backup=True)
+        self.assertEqual(Unisens(folder).key, 'value2')
+        u_bak = Unisens(folder, filename='unisens.xml.bak', readonly=True)
+        self.assertEqual(u_bak.key, 'value1')
+
     def test_load_examples(self):
         example1 = os.path.join(os.path.dirname(__file__), 'Example_001')
 
@@ -303,6 +392,87 @@ class Testing(unittest.TestCase):
         self.assertEqual(len(entry.groupEntry), 2)
         self.assertEqual(len(entry), 2)
 
+    def test_lazy_loading(self):
+        folder = os.path.join(self.tmpdir, 'data', 'lazy')
+        u = Unisens(folder, makenew=True)
+        SignalEntry('signal.bin', parent=u).set_data(np.zeros([2, 10]), sampleRate=1,
+                                                     ch_names=['a', 'b'])
+        EventEntry('events.csv', parent=u).set_data([[1, 'a'], [2, 'b']])
+        CustomEntry('custom.txt', parent=u).set_data('test')
+        u.save()
+        u.validate()
+
+        with mock.patch('unisens.entry.os.access') as access:
+            u1 = Unisens(folder, readonly=True, lazy=True)
+            access.assert_not_called()
+        self.assertTrue(elements_equal(u.to_element(), u1.to_element()))
+        np.testing.assert_array_equal(u1.signal.get_data(), np.zeros([2, 10]))
+
+        os.remove(os.path.join(folder, 'custom.txt'))
+        u1 = Unisens(folder, readonly=True, lazy=True)
+        u1.signal.validate()
+        with self.assertRaises(FileNotFoundError):
+            u1.custom.validate()
+        with self.assertRaises(FileNotFoundError):
+            u1.validate()
+        with self.assertRaises(FileNotFoundError):
+            u1.custom.get_data()
+
+    def test_read_xml(self):
+        """reading the header gives the same entries as unpack_element"""
+        folder = os.path.join(self.tmpdir, 'data', 'read_xml')
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'unisens.xml'), 'w') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                    '<unisens xmlns="http://www.unisens.org/unisens2.0" '
+                    'duration="10" measurementId="test">\n'
+                    '<signalEntry id="sub/ecg.bin" dataType="int16" sampleRate="256">'
+                    '<binFileFormat endianess="LITTLE"/><channel name="a"/>'
+                    '<channel name="b"/></signalEntry>\n'
+                    '<eventEntry id="events.csv" typeLength="1">'
+                    '<csvFileFormat decimalSeparator="," separator="|"/></eventEntry>\n'
+                    '<valuesEntry id="values.csv" sampleRate="1.5">'
+                    '<channel name="v"/></valuesEntry>\n'
+                    '<customEntry id="custom.txt"/>\n'
+                    '<customAttributes><customAttribute key="age" value="20"/>'
+                    '</customAttributes>\n'
+                    '<group id="group"><groupEntry ref="events.csv"/></group>\n'
+                    '<unknown id="x"/>\n'
+                    '</unisens>')
+
+        def assert_same(e1, e2):
+            self.assertIs(type(e1), type(e2))
+            self.assertEqual(e1.attrib, e2.attrib)
+            keys = {key for key in e1.__dict__ if key != '_lookup'}
+            self.assertEqual(keys, {key for key in e2.__dict__ if key != '_lookup'})
+            self.assertEqual(e1._name, e2._name)
+            self.assertEqual(e1._folder, e2._folder)
+            self.assertEqual(e1.__dict__.get('_filename'), e2.__dict__.get('_filename'))
+            self.assertEqual(len(e1._entries), len(e2._entries))
+            for sub1, sub2 in zip(e1._entries, e2._entries):
+                self.assertIs(sub1._parent, e1)
+                assert_same(sub1, sub2)
+
+        example_dir = os.path.join(os.path.dirname(__file__))
+        folders = [folder] + [os.path.join(example_dir, f'Example_00{i}') for i in [1, 2, 3]]
+        for folder in folders:
+            for convert_nums in [False, True]:
+                u = Unisens(folder, readonly=True, lazy=True, convert_nums=convert_nums)
+                root = ET.parse(u._file).getroot()
+                entries = [u.unpack_element(element) for element in root]
+                self.assertEqual(len(u._entries), len(entries))
+                for entry1, entry2 in zip(u._entries, entries):
+                    assert_same(entry1, entry2)
+                attrib = {key: str2num(value) if convert_nums else value
+                          for key, value in root.attrib.items()}
+                self.assertEqual(u.attrib, attrib)
+
+        u = Unisens(folders[0], readonly=True, lazy=True)
+        self.assertEqual(u['events'].csvFileFormat.separator, '|')
+        self.assertEqual(u['values'].csvFileFormat.separator, ';')
+        self.assertEqual(u.customAttributes.age, '20')
+        self.assertEqual(len(u['ecg'].channel), 2)
+
     def test_load_and_save(self):
         # check if loading and saving will reproduce the same tree
         example1 = os.path.join(os.path.dirname(__file__), 'Example_001')
@@ -369,6 +539,10 @@ class Testing(unittest.TestCase):
         self.assertEqual(data[0][0], 10)
         self.assertEqual(data[0][1], 4521)
 
+        data = events.get_data(mode='structured')
+        np.testing.assert_array_equal(data['time'], [10, 4521])
+        np.testing.assert_array_equal(data['label'], ['(', ')'])
+
         custom = u['picture.jpg']
         data = custom.get_data(dtype='binary')
         self.assertEqual(len(data), 724116)
@@ -396,6 +570,554 @@ class Testing(unittest.TestCase):
         folder = os.path.join(self.tmpdir, 'data', 'record')
         u = Unisens(folder, makenew=True)
 
+    def test_set_data_lossless(self):
+        folder = os.path.join(self.tmpdir, 'data', 'lossless')
+        u = Unisens(folder, makenew=True)
+        signal = SignalEntry(id='signal.bin', parent=u)
+        data = np.arange(2 * 2**20, dtype=float).reshape(2, -1) % 1000
+        signal.set_data(data, sampleRate=1, dataType='int16', ch_names=['a', 'b'])
+
+        # only the last block is lossy, the old data is kept
+        lossy = data.copy()
+        lossy[1, -1] += 0.5
+        with self.assertRaisesRegex(AssertionError, 'max. error 0.5'):
+            signal.set_data(lossy, dataType='int16')
+        np.testing.assert_array_equal(signal.get_data(), data)
+        self.assertEqual(os.listdir(folder), ['signal.bin'])
+
+        # the header is not changed by a failed write, even when autosaving
+        u = Unisens(folder, makenew=True, autosave=True)
+        signal = SignalEntry(id='float.bin', parent=u)
+        signal.set_data([[0.5, 1.5]], sampleRate=1, ch_names=['a'])
+        with self.assertRaises(AssertionError):
+            signal.set_data([[0.25, 1.5]], dataType='int16', lsbValue=2)
+        u = Unisens(folder, readonly=True)
+        self.assertEqual(u['float.bin'].dataType, 'double')
+        self.assertEqual(u['float.bin'].lsbValue, '1')
+        np.testing.assert_array_equal(u['float.bin'].get_data(), [[0.5, 1.5]])
+
+        # errors that add up to zero are found as well
+        with self.assertRaises(AssertionError):
+            signal.set_data([[0.25, -0.25]], dataType='int16', ch_names=['a'])
+        with self.assertRaises(AssertionError):
+            signal.set_data([[1, np.nan]], dataType='int32', ch_names=['a'])
+        with self.assertRaises(AssertionError):
+            signal.set_data([[1e10]], dataType='int16', ch_names=['a'])
+        signal.set_data([[1.00000000001, 2]], dataType='int16', ch_names=['a'])
+        np.testing.assert_array_equal(signal.get_data(), [[1, 2]])
+
+        # safe casts are not checked, NaN can be saved as float
+        signal.set_data([[1, np.nan]], dataType='double', ch_names=['a'])
+        np.testing.assert_array_equal(signal.get_data(), [[1, np.nan]])
+        signal.set_data(np.asfortranarray(np.arange(6, dtype='int16').reshape(3, 2)),
+                        dataType='int32', layout='planar', ch_names=['a', 'b', 'c'])
+        np.testing.assert_array_equal(signal.get_data(), np.arange(6).reshape(3, 2))
+
+    def test_get_data_window(self):
+        example3 = os.path.join(os.path.dirname(__file__), 'Example_003')
+        u = Unisens(example3, readonly=True)
+        signal = u['acc_textile_50.bin']
+        full = signal.get_data()
+        full_raw = signal.get_data(scaled=False)
+
+        data = signal.get_data(start=100, stop=250)
+        np.testing.assert_array_equal(data, full[:, 100:250])
+        data = signal.get_data(scaled=False, start=100, stop=250, channels=[2, 0])
+        np.testing.assert_array_equal(data, full_raw[[2, 0], 100:250])
+        data = signal.get_data(start=2, stop=5, unit='seconds', channels='y')
+        np.testing.assert_array_equal(data, full[[1], 100:250])
+        data = signal.get_data(start=1.0, stop=np.float32(3.4))
+        np.testing.assert_array_equal(data, full[:, 1:3])
+        data = signal.get_data(start=np.int64(99.6), stop=249.6)
+        np.testing.assert_array_equal(data, full[:, 99:250])
+        data = signal.get_data(start=-10)
+        np.testing.assert_array_equal(data, full[:, -10:])
+        data = signal.get_data(start=full.shape[1] + 10)
+        self.assertEqual(data.shape, (3, 0))
+
+        # scaling gives the same result as scaling the raw data
+        np.testing.assert_array_equal(full, (full_raw - 2048.0) * 0.00294)
+        self.assertTrue(full.flags.c_contiguous)
+        data = signal.get_data(dtype=np.float32, start=100, stop=250)
+        self.assertEqual(data.dtype, np.float32)
+        np.testing.assert_allclose(data, full[:, 100:250], rtol=1e-6)
+        out = np.zeros((2, 150), dtype=np.float32)
+        data = signal.get_data(start=100, stop=250, channels=[0, 2], out=out)
+        self.assertIs(data, out)
+        np.testing.assert_allclose(out, full[[0, 2], 100:250], rtol=1e-6)
+        with self.assertRaises(ValueError):
+            signal.get_data(start=100, stop=250, out=out)
+
+        with self.assertRaises(KeyError):
+            signal.get_data(channels='not a channel')
+        with self.assertRaises(ValueError):
+            signal.get_data(start=1, unit='minutes')
+
+        folder = os.path.join(self.tmpdir, 'data', 'window_csv')
+        u = Unisens(folder, makenew=True)
+        data1 = np.random.rand(2, 100)
+        signal = SignalEntry(id='signal.csv', parent=u)
+        signal.set_data(data1, sampleRate=10, ch_names=['a', 'b'])
+        data2 = signal.get_data(start=1, stop=2, unit='seconds', channels='b')
+        np.testing.assert_allclose(data2, data1[[1], 10:20])
+
+    def test_get_data_endianess(self):
+        folder = os.path.join(self.tmpdir, 'data', 'endianess')
+        u = Unisens(folder, makenew=True)
+        data = (np.random.rand(3, 1000) * 1000).astype(np.int16)
+        signal = SignalEntry(id='big.bin', parent=u)
+        signal.set_data(data, sampleRate=100, ch_names=['a', 'b', 'c'])
+        data.T.astype('>i2').tofile(signal._filename)
+        signal.binFileFormat.set_attrib('endianess', 'BIG')
+        u.save()
+
+        signal = Unisens(folder)['big.bin']
+        self.assertEqual(signal._bin_dtype(), np.dtype('>i2'))
+        loaded = signal.get_data()
+        np.testing.assert_array_equal(loaded, data)
+        # scaled data is float, even if lsbValue="1" and there is no baseline
+        self.assertEqual(signal.lsbValue, '1')
+        self.assertEqual(loaded.dtype, np.float64)
+        loaded = signal.get_data(scaled=False)
+        np.testing.assert_array_equal(loaded, data)
+        self.assertEqual(loaded.dtype, np.int16)
+        self.assertTrue(loaded.dtype.isnative)
+        np.testing.assert_array_equal(signal.get_data(start=10, stop=20, channels='b'),
+                                      data[[1], 10:20])
+
+        # without copying, a view of the file is returned
+        view = signal.get_data(scaled=False, copy=False, start=100)
+        self.assertIsInstance(view, np.memmap)
+        self.assertFalse(view.flags.writeable)
+        np.testing.assert_array_equal(view, data[:, 100:])
+        # scaling needs a copy
+        signal.set_attrib('lsbValue', 0.5)
+        scaled = signal.get_data(copy=False)
+        self.assertNotIsInstance(scaled, np.memmap)
+        np.testing.assert_array_equal(scaled, data * 0.5)
+        signal.set_attrib('lsbValue', 1)
+
+        # appending keeps the byte order of the file
+        with signal.writer(mode='a') as writer:
+            writer.write(data)
+        np.testing.assert_array_equal(signal.get_data(), np.hstack([data, data]))
+
+        signal.binFileFormat.set_attrib('endianess', 'MIDDLE')
+        with self.assertRaises(ValueError):
+            signal.get_data()
+
+    def test_planar_layout(self):
+        folder = os.path.join(self.tmpdir, 'data', 'planar')
+        u = Unisens(folder, makenew=True)
+        data = (np.random.rand(4, 1000) * 1000).astype(np.int32)
+        signal = SignalEntry(id='planar.bin', parent=u)
+        signal.set_data(data, sampleRate=100, ch_names=['a', 'b', 'c', 'd'],
+                        layout='planar', lsbValue=2)
+        np.testing.assert_array_equal(np.fromfile(signal._filename, dtype=np.int32),
+                                      data.ravel())
+        u.save()
+
+        signal = Unisens(folder)['planar.bin']
+        self.assertEqual(signal.binFileFormat.layout, 'planar')
+        np.testing.assert_array_equal(signal.get_data(), data * 2)
+        np.testing.assert_array_equal(signal.get_data(scaled=False, start=10, stop=20,
+                                                      channels=['d', 'b']),
+                                      data[[3, 1], 10:20])
+        view = signal.get_data(scaled=False, copy=False, channels=2)
+        self.assertIsInstance(view, np.memmap)
+        np.testing.assert_array_equal(view, data[[2]])
+
+        with self.assertRaises(ValueError):
+            signal.writer(mode='a')
+        # writing a new file uses the default layout
+        with signal.writer(mode='w') as writer:
+            writer.write(data)
+        self.assertNotIn('layout', signal.binFileFormat.attrib)
+        np.testing.assert_array_equal(signal.get_data(scaled=False), data)
+
+    def test_compressed_signal(self):
+        folder = os.path.join(self.tmpdir, 'data', 'compressed')
+        data = (np.sin(np.arange(10000) / 50) * 1000 + np.arange(3)[:, None]).astype(np.int16)
+        for compression in ['zlib', 'lzma']:
+            u = Unisens(folder, makenew=True)
+            signal = SignalEntry(id='signal.bin', parent=u)
+            signal.set_data(data, sampleRate=100, ch_names=['a', 'b', 'c'],
+                            lsbValue=0.5, compression=compression, blockSize=1000)
+            self.assertLess(os.path.getsize(signal._filename), data.nbytes)
+            u.save()
+
+            signal = Unisens(folder)['signal.bin']
+            self.assertEqual(signal.binFileFormat.compression, compression)
+            np.testing.assert_array_equal(signal.get_data(), data * 0.5)
+            np.testing.assert_array_equal(signal.get_data(scaled=False, copy=False),
+                                          data)
+            for start, stop in [(0, 1), (999, 1001), (2500, 7500), (9990, 20000)]:
+                np.testing.assert_array_equal(
+                    signal.get_data(scaled=False, start=start, stop=stop, channels=[2, 0]),
+                    data[[2, 0], start:stop])
+
+            # only the overlapping blocks are decompressed
+            _, decompress = unisens.entry.get_codec(compression)
+            with mock.patch('unisens.entry.get_codec',
+                            return_value=(None, mock.Mock(wraps=decompress))) as codec:
+                signal.get_data(start=1500, stop=3500)
+                self.assertEqual(codec.return_value[1].call_count, 3)
+
+        with self.assertRaises(ValueError):
+            signal.writer(mode='a')
+        with self.assertRaises(ValueError):
+            signal.set_data(data, compression='rar')
+        signal.set_data(data)
+        self.assertFalse(os.path.exists(signal._filename + '.idx'))
+        np.testing.assert_array_equal(signal.get_data(scaled=False), data)
+
+    def test_pyramid(self):
+        folder = os.path.join(self.tmpdir, 'data', 'pyramid')
+        u = Unisens(folder, makenew=True)
+        data = (np.random.rand(2, 100003) * 1000).astype(np.int16)
+        signal = SignalEntry(id='signal.bin', parent=u)
+        signal.set_data(data, sampleRate=100, ch_names=['a', 'b'], lsbValue=0.5)
+        signal.build_pyramid(decimation=10, factor=4, chunksize=1000)
+        self.assertEqual(int(signal.pyramid.levels), 8)
+        u.save()
+
+        u = Unisens(folder)
+        signal = u['signal.bin']
+        scaled = data * 0.5
+        for decimation, n_bins, offset in signal._pyramid_levels():
+            # compare the last (partial) bin and a full bin with the data
+            for i in [n_bins - 1, n_bins // 2]:
+                window = scaled[:, i * decimation:(i + 1) * decimation]
+                overview = signal.get_overview(start=i * decimation,
+                                               stop=(i + 1) * decimation, width=1)
+                if overview.decimation != decimation:
+                    continue
+                np.testing.assert_allclose(overview.min[:, 0], window.min(1))
+                np.testing.assert_allclose(overview.max[:, 0], window.max(1))
+                np.testing.assert_allclose(overview.mean[:, 0], window.mean(1), rtol=1e-5)
+
+        overview = signal.get_overview(width=100, channels='b')
+        self.assertEqual(overview.decimation, 640)
+        self.assertEqual(overview.min.shape, (1, 157))
+        self.assertEqual(overview.min.min(), scaled[1].min())
+        self.assertEqual(overview.times[1], 6.4)
+        overview = signal.get_overview(start=10, stop=20, unit='seconds', width=500)
+        self.assertEqual(overview.decimation, 2)
+        np.testing.assert_array_equal(overview.max, scaled[:, 1000:2000].reshape(2, -1, 2).max(2))
+
+        # new data removes the pyramid, it is rebuilt if necessary
+        signal.set_data(data[:, :5000])
+        self.assertNotIn('pyramid', signal)
+        self.assertFalse(os.path.exists(signal._filename + '.pyramid'))
+        overview = signal.get_overview(width=10)
+        self.assertEqual(overview.decimation, 256)
+        self.assertIn('pyramid', signal)
+        u.save()
+
+        u = Unisens(folder, readonly=True)
+        overview = u.signal.get_overview(width=10)
+        self.assertEqual(overview.decimation, 256)
+        # without pyramid, read-only entries compute the bins from the data
+        os.remove(u.signal._filename + '.pyramid')
+        overview = u.signal.get_overview(width=10)
+        self.assertEqual(overview.decimation, 500)
+        np.testing.assert_array_equal(overview.min[:, 0], scaled[:, :500].min(1))
+
+        # csv signals have no pyramid, the bins are computed from the data
+        csv = SignalEntry(id='signal.csv', parent=Unisens(folder))
+        csv.set_data(data[:, :1000], sampleRate=100, ch_names=['a', 'b'])
+        overview = csv.get_overview(width=10)
+        self.assertEqual(overview.decimation, 100)
+        self.assertEqual(overview.min.shape, (2, 10))
+        np.testing.assert_allclose(overview.max[:, 1], data[:, 100:200].max(1))
+        overview = csv.get_overview(start=2, stop=4, unit='seconds', width=2, channels='b')
+        np.testing.assert_allclose(overview.mean, [data[1, 200:400].reshape(2, -1).mean(1)])
+        self.assertFalse(os.path.exists(csv._filename + '.pyramid'))
+
+    def test_data_cache(self):
+        folder = os.path.join(self.tmpdir, 'data', 'cache')
+        u = Unisens(folder, makenew=True, cache_bytes=10000)
+        data = np.random.rand(2, 500)
+        signal = SignalEntry(id='signal.bin', parent=u)
+        signal.set_data(data, sampleRate=100, ch_names=['a', 'b'])
+        custom = CustomEntry('test.txt', parent=u).set_data('content')
+
+        data1 = signal.get_data(start=0, stop=100)
+        data2 = signal.get_data(start=0, stop=100)
+        self.assertIs(data1, data2)
+        self.assertFalse(data1.flags.writeable)
+        self.assertIsNot(signal.get_data(start=0, stop=101), data1)
+        self.assertEqual(custom.get_data(), 'content')
+        self.assertEqual(custom.get_data(), 'content')
+        self.assertEqual(u.cache_info()['hits'], 2)
+        self.assertEqual(u.cache_info()['misses'], 3)
+        self.assertEqual(u.cache_info()['n_bytes'], 1600 + 1616 + 7)
+
+        # the budget is respected, least recently used data is removed
+        full = signal.get_data()
+        self.assertEqual(u.cache_info()['items'], 3)
+        self.assertLessEqual(u.cache_info()['n_bytes'], 10000)
+        self.assertIs(signal.get_data(), full)
+        self.assertIsNot(signal.get_data(start=0, stop=100), data1)
+
+        # new data invalidates the cache
+        signal.set_data(data * 2)
+        np.testing.assert_array_equal(signal.get_data(), data * 2)
+        with signal.writer(mode='a') as writer:
+            writer.write(data)
+        self.assertEqual(signal.get_data().shape, (2, 1000))
+
+        # changed attributes are not read from the cache
+        raw = signal.get_data(stop=100)
+        self.assertIs(signal.get_data(stop=100), raw)
+        signal.set_attrib('lsbValue', 0.5)
+        np.testing.assert_array_equal(signal.get_data(stop=100), raw * 0.5)
+        signal.set_attrib('baseline', 1)
+        np.testing.assert_array_equal(signal.get_data(stop=100), (raw - 1) * 0.5)
+        signal.remove_attr('baseline')
+        np.testing.assert_array_equal(signal.get_data(stop=100), raw * 0.5)
+
+        # the dataType that get_data sets on a CustomEntry does not change the key
+        with open(os.path.join(folder, 'plain.txt'), 'w') as f:
+            f.write('plain')
+        plain = CustomEntry('plain.txt', parent=u)
+        self.assertNotIn('dataType', plain.attrib)
+        hits = u.cache_info()['hits']
+        self.assertEqual(plain.get_data(), 'plain')
+        self.assertEqual(plain.dataType, 'text')
+        self.assertEqual(plain.get_data(), 'plain')
+        self.assertEqual(plain.get_data(dtype='text'), 'plain')
+        self.assertEqual(u.cache_info()['hits'], hits + 2)
+        self.assertEqual(plain.get_data(dtype='binary'), b'plain')
+        self.assertEqual(plain.dataType, 'binary')
+
+        # lists are cached as well, callers get a copy
+        values = ValuesEntry('values.csv', parent=u)
+        values.set_data([[0, 1.5], [1, 2.5]], sampleRate=1, ch_names=['a'])
+        hits = u.cache_info()['hits']
+        rows = values.get_data()
+        rows[0][1] = 100
+        self.assertEqual(values.get_data(), [[0, 1.5], [1, 2.5]])
+        self.assertEqual(u.cache_info()['hits'], hits + 1)
+        json_entry = CustomEntry('info.json', parent=u).set_data({'a': [1, 2]})
+        json_entry.get_data()['a'].append(3)
+        self.assertEqual(json_entry.get_data(), {'a': [1, 2]})
+        self.assertEqual(u.cache_info()['hits'], hits + 2)
+
+        u.clear_cache(max_bytes=0)
+        self.assertEqual(u.cache_info()['items'], 0)
+        self.assertIsNot(signal.get_data(stop=10), signal.get_data(stop=10))
+        self.assertTrue(signal.get_data(stop=10).flags.writeable)
+
+    def test_get_data_many(self):
+        example3 = os.path.join(os.path.dirname(__file__), 'Example_003')
+        u = Unisens(example3, readonly=True)
+        data = u.get_data_many(n_workers=4)
+        ids = [e.id for e in u if isinstance(e, (SignalEntry, ValuesEntry))]
+        self.assertEqual(list(data), ids)
+        for id in ids:
+            if isinstance(u[id], SignalEntry):
+                np.testing.assert_array_equal(data[id], u[id].get_data())
+            else:
+                self.assertEqual(data[id], u[id].get_data())
+
+        signal_id = [id for id in ids if isinstance(u[id], SignalEntry)][0]
+        data = u.get_data_many([signal_id], scaled=False, start=10, stop=20)
+        np.testing.assert_array_equal(data[signal_id],
+                                      u[signal_id].get_data(scaled=False)[:, 10:20])
+        data = u.get_data_many(['bloodpressure', 'trigger_reference'], mode='numpy')
+        self.assertIsInstance(data['bloodpressure.csv'], np.ndarray)
+        self.assertIsInstance(data['trigger_reference.csv'], np.ndarray)
+
+    def test_get_epochs(self):
+        folder = os.path.join(self.tmpdir, 'data', 'epochs')
+        u = Unisens(folder, makenew=True)
+        data1 = np.arange(2000, dtype='int16').reshape(2, 1000)
+        data2 = np.random.rand(1, 500)
+        SignalEntry('ecg.bin', parent=u).set_data(data1, sampleRate=100, lsbValue=0.5,
+                                                  ch_names=['a', 'b'])
+        SignalEntry('eeg.bin', parent=u).set_data(data2, sampleRate=50, ch_names=['c'],
+                                                  compression='zlib', blockSize=64)
+        EventEntry('events.csv', parent=u).set_data([[20, 'N'], [5, 'A'], [1, 'N'],
+                                                     [99, 'N'], [21, 'N']], sampleRate=10)
+
+        epochs = u.get_epochs('events', pre=0.2, post=0.3)
+        self.assertEqual(list(epochs), ['ecg.bin', 'eeg.bin'])
+        self.assertEqual(epochs['ecg.bin'].shape, (5, 2, 50))
+        self.assertEqual(epochs['eeg.bin'].shape, (5, 1, 25))
+        # events are sorted by time: 0.1, 0.5, 2.0, 2.1 and 9.9 seconds
+        ecg, eeg = epochs['ecg.bin'], epochs['eeg.bin']
+        np.testing.assert_array_equal(ecg[1], data1[:, 30:80] * 0.5)
+        np.testing.assert_array_equal(ecg[3], data1[:, 190:240] * 0.5)
+        np.testing.assert_array_equal(eeg[2], data2[:, 90:115])
+        # windows beyond the signal are filled
+        self.assertTrue(np.isnan(ecg[0, :, :10]).all())
+        np.testing.assert_array_equal(ecg[0, :, 10:], data1[:, :40] * 0.5)
+        np.testing.assert_array_equal(ecg[4, :, :30], data1[:, 970:] * 0.5)
+        self.assertTrue(np.isnan(ecg[4, :, 30:]).all())
+        np.testing.assert_array_equal(eeg[4, :, :15], data2[:, 485:])
+        self.assertTrue(np.isnan(eeg[4, :, 15:]).all())
+
+        epochs = u.get_epochs('events', pre=0, post=0.2, signals=['ecg'], labels=['N'],
+                              channels=['b'], scaled=False, dtype=np.int32, fill_value=-1)
+        self.assertEqual(list(epochs), ['ecg.bin'])
+        np.testing.assert_array_equal(epochs['ecg.bin'][:, 0, 0], [1010, 1200, 1210, 1990])
+        np.testing.assert_array_equal(epochs['ecg.bin'][3, 0, :10], np.arange(1990, 2000))
+        np.testing.assert_array_equal(epochs['ecg.bin'][3, 0, 10:], -1)
+
+        epochs = u.get_epochs([0.5, 0.6], pre=0.1, post=0.1, signals=['ecg.bin'])
+        np.testing.assert_array_equal(epochs['ecg.bin'][1], data1[:, 50:70] * 0.5)
+
+        # reading overlapping windows together gives the same result
+        starts = [50, -5, 10, 12, 990, 11]
+        signal = u['ecg.bin']
+        np.testing.assert_array_equal(signal.get_epochs(starts, 20, max_read=1),
+                                      signal.get_epochs(starts, 20))
+
+    def test_iter_chunks(self):
+        folder = os.path.join(self.tmpdir, 'data', 'chunks')
+        u = Unisens(folder, makenew=True)
+        data = np.random.randint(-1000, 1000, [3, 1000]).astype('int16')
+        signal = SignalEntry('signal.bin', parent=u)
+        signal.set_data(data, sampleRate=100, lsbValue=0.5, ch_names=['a', 'b', 'c'])
+
+        for compression in [None, 'zlib']:
+            signal.set_data(data, compression=compression, blockSize=64)
+            chunks = [chunk.copy() for chunk in signal.iter_chunks(300, overlap=50)]
+            self.assertEqual([c.shape for c in chunks], [(3, 300)] * 3 + [(3, 250)])
+            for i, chunk in enumerate(chunks):
+                np.testing.assert_array_equal(chunk, data[:, i * 250:i * 250 + 300] * 0.5)
+
+        # the same buffer is used for all chunks
+        buffers = [chunk for chunk in signal.iter_chunks(400, scaled=False)]
+        self.assertTrue(all(np.shares_memory(buffers[0], b) for b in buffers))
+
+        chunks = list(signal.iter_chunks(100, overlap=99, channels='b', start=1,
+                                         stop=3, unit='seconds', dtype=np.float32))
+        self.assertEqual(len(chunks), 101)
+        self.assertEqual(chunks[-1].dtype, np.float32)
+        np.testing.assert_array_equal(chunks[-1], data[1:2, 200:300] * 0.5)
+        self.assertEqual(list(signal.iter_chunks(10, start=1000)), [])
+        with self.assertRaises(ValueError):
+            next(signal.iter_chunks(10, overlap=10))
+
+    def test_get_aligned(self):
+        folder = os.path.join(self.tmpdir, 'data', 'aligned')
+        u = Unisens(folder, makenew=True)
+        # ramps with the time in seconds as value
+        ramp = np.arange(2560) / 256
+        SignalEntry('fast.bin', parent=u).set_data(np.stack([ramp, -ramp]), sampleRate=256,
+                                                   ch_names=['a', 'b'])
+        SignalEntry('slow.bin', parent=u).set_data(np.arange(16)[None] / 2, sampleRate=2,
+                                                   ch_names=['c'])
+        ValuesEntry('values.csv', parent=u).set_data([[2, 1.0], [6, 3.0], [18, 0.0]],
+                                                     sampleRate=2, ch_names=['d'])
+
+        aligned = u.get_aligned(sampleRate=64)
+        self.assertEqual(list(aligned.data), ['fast.bin', 'slow.bin', 'values.csv'])
+        n = int(9.99609375 * 64) + 1  # the last sample of fast.bin
+        np.testing.assert_allclose(aligned.times, np.arange(n) / 64)
+        np.testing.assert_allclose(aligned.data['fast.bin'], [aligned.times, -aligned.times])
+        slow = aligned.data['slow.bin'][0]
+        np.testing.assert_allclose(slow[:481], aligned.times[:481])
+        self.assertTrue(np.isnan(slow[481:]).all())
+        values = aligned.data['values.csv'][0]
+        np.testing.assert_allclose(values, np.interp(aligned.times, [1, 3, 9], [1, 3, 0],
+                                                     left=np.nan, right=np.nan))
+
+        # chunks give the same result
+        chunks = list(u.iter_aligned(sampleRate=64, chunksize=100))
+        self.assertEqual(len(chunks), 7)
+        for id, data in aligned.data.items():
+            np.testing.assert_array_equal(np.hstack([c.data[id] for c in chunks]), data)
+
+        aligned = u.get_aligned(['values', 'slow.bin'], master='slow.bin', start=1)
+        np.testing.assert_allclose(aligned.times, np.arange(2, 16) / 2)
+        np.testing.assert_allclose(aligned.data['slow.bin'][0], aligned.times)
+        with self.assertRaises(ValueError):
+            u.get_aligned(['fast.bin'], sampleRate=64, method='cubic')
+
+        # csv signals are parsed only once, not for every chunk
+        SignalEntry('csv.csv', parent=u).set_data(ramp[None, :2000], sampleRate=256,
+                                                  ch_names=['e'])
+        with mock.patch.object(np, 'genfromtxt', wraps=np.genfromtxt) as genfromtxt:
+            chunks = list(u.iter_aligned(['csv.csv'], sampleRate=64, chunksize=100))
+            self.assertEqual(genfromtxt.call_count, 1)
+            chunks = list(u.iter_aligned(['csv.csv'], sampleRate=64, chunksize=10))
+            self.assertEqual(genfromtxt.call_count, 1)
+        self.assertEqual(len(chunks), 50)
+        np.testing.assert_allclose(np.hstack([c.data['csv.csv'] for c in chunks])[0],
+                                   np.arange(500) / 64, atol=1e-12)
+        u['csv.csv'].set_data(ramp[None, :1000] * 2, ch_names=['e'])
+        aligned = u.get_aligned(['csv.csv'], sampleRate=64)
+        np.testing.assert_allclose(aligned.data['csv.csv'][0], np.arange(250) / 32)
+
+        try:
+            from scipy.signal import resample_poly
+        except ImportError:
+            return
+        aligned = u.get_aligned(['fast'], sampleRate=64, method='polyphase', chunksize=7)
+        np.testing.assert_allclose(aligned.data['fast.bin'],
+                                   resample_poly(np.stack([ramp, -ramp]), 1, 4, axis=1))
+
+    def test_signal_writer(self):
+        folder = os.path.join(self.tmpdir, 'data', 'writer')
+        u = Unisens(folder, makenew=True, autosave=True)
+        blocks = [(np.random.rand(2, 300) * 100).astype(np.int16) for _ in range(3)]
+        signal = SignalEntry(id='signal.bin', parent=u)
+        with signal.writer(sampleRate=100, ch_names=['a', 'b'], unit='mV') as writer:
+            for block in blocks:
+                writer.write(block)
+            self.assertEqual(writer.n_samples, 900)
+        np.testing.assert_array_equal(signal.get_data(), np.hstack(blocks))
+        self.assertEqual(signal.dataType, 'int16')
+        self.assertEqual(signal.unit, 'mV')
+        self.assertEqual(u.duration, 9)
+
+        with signal.writer(mode='a') as writer:
+            writer.write(blocks[0][:, :50])
+            with self.assertRaises(AssertionError):
+                writer.write(blocks[0][:1])
+            with self.assertRaises(AssertionError):
+                writer.write(blocks[0] + 0.5)
+        np.testing.assert_array_equal(signal.get_data(),
+                                      np.hstack(blocks + [blocks[0][:, :50]]))
+        self.assertEqual(u.duration, 9.5)
+
+        u = Unisens(folder)
+        self.assertEqual(u.duration, '9.5')
+        self.assertEqual(u.signal.sampleCount, '950')
+        self.assertEqual(u.signal.get_data().shape, (2, 950))
+
+        # writers that are closed without data leave complete empty signals
+        with SignalEntry(id='empty.bin', parent=u).writer(sampleRate=10, ch_names=['a']):
+            pass
+        with SignalEntry(id='typed.bin', parent=u).writer(sampleRate=10, dataType='int16',
+                                                          ch_names=['a', 'b']):
+            pass
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', DeprecationWarning)
+            SignalEntry(id='unnamed.bin', parent=u).writer(sampleRate=10).close()
+        u.save()
+        u = Unisens(folder)
+        self.assertEqual(u.empty.dataType, 'double')
+        self.assertEqual(u.typed.dataType, 'int16')
+        self.assertEqual(u.typed.sampleCount, '0')
+        self.assertEqual(u.unnamed._n_channels(), 1)
+        self.assertEqual(u.typed.get_data().shape, (2, 0))
+        data = u.get_data_many()
+        self.assertEqual(data['unnamed.bin'].shape, (1, 0))
+        epochs = u.get_epochs([1.0], pre=0, post=0.5)
+        self.assertTrue(np.isnan(epochs['typed.bin']).all())
+        self.assertEqual(u.get_aligned(sampleRate=10).data['typed.bin'].shape, (2, 95))
+        # set_data keeps the sampleCount up to date
+        u.typed.set_data(np.zeros([2, 30]))
+        self.assertEqual(u.typed.sampleCount, 30)
+
+        u = Unisens(folder, readonly=True)
+        with self.assertRaises(IOError):
+            u.signal.writer()
+
     def test_save_customtypes(self):
         folder = os.path.join(self.tmpdir, 'data', 'customtypes')
         from collections import OrderedDict
@@ -469,6 +1191,142 @@ class Testing(unittest.TestCase):
         times2 = event2.get_data()
         np.testing.assert_allclose(times, times2)
 
+    def test_get_data_structured(self):
+        example1 = os.path.join(os.path.dirname(__file__), 'Example_001')
+        example3 = os.path.join(os.path.dirname(__file__), 'Example_003')
+        u = Unisens(example1, readonly=True)
+        data = u['trig_ref.csv'].get_data(mode='structured')
+        times = u['trig_ref.csv'].get_times()
+        self.assertEqual(data.dtype.names, ('time', 'label'))
+        np.testing.assert_array_equal(data['time'], times)
+        np.testing.assert_array_equal(data['label'], u['trig_ref.csv'].get_labels())
+
+        data = u['bp.csv'].get_data(mode='structured')
+        self.assertEqual(data.dtype.names, ('time', 'systolisch', 'diastolisch'))
+        np.testing.assert_array_equal(data['systolisch'], [130, 125, 140, 170])
+
+        # csvFileFormat without decimalSeparator
+        u = Unisens(example3, readonly=True)
+        data = u['trigger_reference.csv'].get_data(mode='structured')
+        self.assertEqual(data['time'][0], 575)
+        self.assertEqual(data['label'][0], 'N')
+
+        folder = os.path.join(self.tmpdir, 'data', 'structured')
+        u = Unisens(folder, makenew=True)
+        times = [[i * 100 + float(np.random.rand()), f'trigger {i}'] for i in range(15)]
+        event = EventEntry(id='triggers.csv', parent=u, separator=';', decimalSeparator=',')
+        event.set_data(times)
+        data = event.get_data(mode='structured')
+        np.testing.assert_array_equal(data['time'], [t for t, _ in times])
+        np.testing.assert_array_equal(data['label'], [l for _, l in times])
+
+    def test_time_queries(self):
+        folder = os.path.join(self.tmpdir, 'data', 'time_queries')
+        u = Unisens(folder, makenew=True)
+        events = [[t, f'event {t}'] for t in [500, 100, 300, 200, 400, 300]]
+        event = EventEntry(id='events.csv', parent=u, sampleRate=100)
+        event.set_data(events)
+
+        result = event.get_range(200, 400)
+        np.testing.assert_array_equal(result.samples, [200, 300, 300])
+        np.testing.assert_array_equal(result.seconds, [2, 3, 3])
+        np.testing.assert_array_equal(result.labels, ['event 200', 'event 300', 'event 300'])
+        result = event.get_range(start=3.5, unit='seconds')
+        np.testing.assert_array_equal(result.labels, ['event 400', 'event 500'])
+        self.assertEqual(len(event.get_range(stop=100).samples), 0)
+        self.assertEqual(len(event.get_range(start=600).samples), 0)
+        self.assertEqual(len(event.get_range(300, 200).samples), 0)
+
+        self.assertEqual(event.get_nearest(240).labels, 'event 200')
+        self.assertEqual(event.get_nearest(0).labels, 'event 100')
+        self.assertEqual(event.get_nearest(10, unit='seconds').labels, 'event 500')
+        result = event.get_nearest([140, 160, 251])
+        np.testing.assert_array_equal(result.samples, [100, 200, 300])
+
+        # the index is only rebuilt when the file changes
+        with mock.patch.object(event, 'get_data', wraps=event.get_data) as get_data:
+            event.get_range(0, 1000)
+            event.get_nearest(0)
+            self.assertEqual(get_data.call_count, 0)
+            event.set_data([[1, 'new']])
+            np.testing.assert_array_equal(event.get_range().labels, ['new'])
+            self.assertEqual(get_data.call_count, 1)
+
+        values = ValuesEntry(id='values.csv', parent=u, sampleRate=2)
+        values.set_data([[0, 1.5, 2], [2, 2.5, 3], [4, 3.5, 4]], ch_names=['a', 'b'])
+        result = values.get_range(1, 2, unit='seconds')
+        np.testing.assert_array_equal(result.data['a'], [2.5])
+        self.assertNotIn('labels', result)
+
+        # empty and comment-only files
+        for content in ['', '# only a comment\n']:
+            with open(event._filename, 'w') as f:
+                f.write(content)
+            result = event.get_range()
+            self.assertEqual(len(result.samples), 0)
+            self.assertEqual(result.data.dtype.names, ('time', 'label', 'comment'))
+            self.assertEqual(len(result.labels), 0)
+            with self.assertRaisesRegex(ValueError, 'contains no data'):
+                event.get_nearest(0)
+        empty = ValuesEntry(id='empty.csv', parent=u, sampleRate=2)
+        empty.set_data([[0, 1]], ch_names=[None])
+        with open(empty._filename, 'w') as f:
+            f.write('# no values\n')
+        self.assertEqual(empty.get_range(1, 2).data.dtype.names, ('time', 'f1'))
+        with self.assertRaisesRegex(ValueError, 'contains no data'):
+            empty.get_nearest([0, 1])
+
+    def test_csv_writer(self):
+        folder = os.path.join(self.tmpdir, 'data', 'csv_writer')
+        u = Unisens(folder, makenew=True, autosave=True)
+        event = EventEntry(id='events.csv', parent=u, separator=',', decimalSeparator='.')
+        with event.writer(sampleRate=100, buffer_size=2) as writer:
+            writer.append(100, 'first')
+            self.assertEqual(event.get_data(), [])
+            writer.append(100.5, 'second')
+            # the buffer is written, the file is complete
+            self.assertEqual(event.get_data(), [[100, 'first'], [100.5, 'second']])
+            writer.extend([[200, 'third'], [300, 'fourth']])
+            with self.assertRaises(ValueError):
+                writer.append(299, 'too early')
+        self.assertEqual(writer.n_rows, 4)
+        self.assertEqual(Unisens(folder).events.sampleRate, '100')
+
+        # continue an existing file that misses the last newline
+        with open(event._filename, 'a') as f:
+            f.write('400,fifth')
+        with event.writer() as writer:
+            with self.assertRaises(ValueError):
+                writer.append(399, 'too early')
+            writer.append(500, 'sixth')
+        self.assertEqual(event.get_labels(), ['first', 'second', 'third',
+                                              'fourth', 'fifth', 'sixth'])
+
+        # append to a file that only contains a comment
+        comments = EventEntry(id='comments.csv', parent=u, separator=',')
+        with open(comments._filename, 'w') as f:
+            f.write('# time,label')
+        with comments.writer() as writer:
+            self.assertIsNone(writer.last_time)
+            writer.append(5, 'first')
+        with open(comments._filename) as f:
+            self.assertEqual(f.read(), '# time,label\n5,first\n')
+        self.assertEqual(comments.get_data(), [[5, 'first']])
+
+        values = ValuesEntry(id='values.csv', parent=u, separator=';', decimalSeparator=',')
+        with mock.patch.object(values, '_set_channels', wraps=values._set_channels) as ch:
+            with values.writer(mode='w', ch_names=['a', 'b'], sampleRate=1) as writer:
+                writer.append(0, 1.5, 2)
+                writer.extend(np.array([[1, 2.5, 3], [2, 3.5, 4]]))
+                with self.assertRaises(ValueError):
+                    writer.append(3, 1.5)
+            self.assertEqual(ch.call_count, 1)
+        self.assertEqual(values.get_data(), [[0, 1.5, 2], [1.0, 2.5, 3.0], [2.0, 3.5, 4.0]])
+        with open(values._filename) as f:
+            self.assertEqual(f.readline(), '0;1,5;2\n')
+        u = Unisens(folder)
+        self.assertEqual([ch.name for ch in u['values'].channel], ['a', 'b'])
+
     def test_save_valuesentry(self):
         folder = os.path.join(self.tmpdir, 'data', 'record1')
 
@@ -683,6 +1541,37 @@ class Testing(unittest.TestCase):
         with self.assertRaises(IndexError):
             self.assertEqual(c._get_index('feat'), (0, 'feat_txt'))
 
+    def test_indexfinding_updates(self):
+        """the lookup tables must follow adding, removing and renaming"""
+        folder = os.path.join(self.tmpdir, 'index_updates')
+        c = CustomEntry(id='test.bin', parent=folder)
+        FileEntry('feat1.txt', parent=c)
+        FileEntry('sub/feat2.txt', parent=c)
+        self.assertEqual(c._get_index('feat2'), (1, 'sub_feat2_txt'))
+
+        FileEntry('feat2.bin', parent=c)
+        with self.assertRaises(IndexError):
+            c._get_index('feat2')
+        self.assertEqual(c._get_index('feat2.bin'), (2, 'feat2_bin'))
+
+        c.remove_entry('feat1.txt')
+        with self.assertRaises(KeyError):
+            c._get_index('feat1')
+        self.assertEqual(c._get_index('feat2.txt'), (0, 'sub_feat2_txt'))
+        self.assertEqual(c._get_index('feat2.bin'), (1, 'feat2_bin'))
+
+        c.feat2_bin.set_attrib('id', 'feat3.bin')
+        self.assertEqual(c._get_index('feat3'), (1, 'feat3_bin'))
+        self.assertEqual(c._get_index('feat2'), (0, 'sub_feat2_txt'))
+
+        u = Unisens(os.path.join(self.tmpdir, 'index_unisens'), makenew=True)
+        for i in range(50):
+            EventEntry(f'events_{i}.csv', parent=u)
+        u.remove_entry('events_10')
+        self.assertNotIn('events_10', u)
+        self.assertEqual(u._get_index('events_11'), (10, 'events_11_csv'))
+        self.assertIs(u.events_49, u[-1])
+
     def test_nooverwrite(self):
         folder = os.path.join(self.tmpdir, 'no_overwrite')
         u = Unisens(folder, makenew=True, autosave=True)
@@ -8,6 +8,7 @@ import os
 from unisens import utils
 import unittest
 import shutil
+import pickle
 import numpy as np
 
 
@@ -94,6 +95,71 @@ class Testing(unittest.TestCase):
         with self.assertRaises(ValueError):
             utils.write_csv(file, np.random.rand(3, 3, 3))
 
+    def test_write_csv_array(self):
+        # numeric arrays take a faster path, output must be the same
+        file_array = os.path.join(self.tmpdir, 'array.csv')
+        file_list = os.path.join(self.tmpdir, 'list.csv')
+        arrays = [np.random.rand(50, 3), np.random.rand(20) * 1e20,
+                  np.random.randint(-5, 5, (10, 4)), np.array([[True, False]]),
+                  np.zeros((3, 0)), np.zeros((0, 3))]
+        for arr in arrays:
+            for sep, decimal_sep in [(';', '.'), (';', ','), ('.', ',')]:
+                utils.write_csv(file_array, arr, sep=sep, decimal_sep=decimal_sep,
+                                comment='test', chunksize=7)
+                utils.write_csv(file_list, arr.tolist(), sep=sep,
+                                decimal_sep=decimal_sep, comment='test')
+                with open(file_array) as f1, open(file_list) as f2:
+                    self.assertEqual(f1.read(), f2.read())
+
+        arr = np.random.rand(10, 2)
+        utils.write_csv(file_array, arr, decimal_sep=',', chunksize=3)
+        read = utils.read_csv(file_array, decimal_sep=',', convert_nums=True)
+        np.testing.assert_array_equal(arr, read)
+
+    def test_read_csv_structured(self):
+        file = os.path.join(self.tmpdir, 'file.csv')
+        with open(file, 'w') as f:
+            f.write('# comment\n1;a;\n2;b;x\n\n# comment\n3;c;\n')
+        data = utils.read_csv_structured(file, names=['time', 'label'], chunksize=2)
+        self.assertEqual(data.dtype.names, ('time', 'label', 'f2'))
+        self.assertEqual(data['time'].dtype, np.int64)
+        np.testing.assert_array_equal(data['time'], [1, 2, 3])
+        np.testing.assert_array_equal(data['label'], ['a', 'b', 'c'])
+        np.testing.assert_array_equal(data['f2'], ['', 'x', ''])
+
+        times = np.random.rand(100) * 1000
+        values = np.random.randint(0, 100, [100, 2])
+        rows = [[t, v1, v2] for t, (v1, v2) in zip(times, values.tolist())]
+        utils.write_csv(file, rows, sep=';', decimal_sep=',')
+        data = utils.read_csv_structured(file, names=['time', 'a', 'b'],
+                                         decimal_sep=',', chunksize=7)
+        np.testing.assert_array_equal(data['time'], times)
+        np.testing.assert_array_equal(data['a'], values[:, 0])
+        self.assertEqual(data['a'].dtype, np.int64)
+
+        # forced string dtype and separators with whitespace
+        with open(file, 'w') as f:
+            f.write('10, 1\n20 ,2_0\n')
+        data = utils.read_csv_structured(file, sep=',', dtypes={'f1': str})
+        np.testing.assert_array_equal(data['f0'], [10, 20])
+        np.testing.assert_array_equal(data['f1'], ['1', '2_0'])
+
+        with open(file, 'w') as f:
+            f.write('# only a comment\n')
+        data = utils.read_csv_structured(file)
+        self.assertEqual(len(data), 0)
+        data = utils.read_csv_structured(file, names=['time', 'label'],
+                                         dtypes={'label': str})
+        self.assertEqual(len(data), 0)
+        self.assertEqual(data.dtype.names, ('time', 'label'))
+        self.assertEqual(data['time'].dtype, np.float64)
+        self.assertEqual(data['label'].dtype.kind, 'U')
+
+        open(file, 'w').close()
+        data = utils.read_csv_structured(file, names=['time', None, 'time'])
+        self.assertEqual(data.dtype.names, ('time', 'f1', 'f2'))
+        self.assertEqual(data['time'].shape, (0,))
+
     def test_make_key(self):
         s = 'abcde12345'
         r = utils.make_key(s)
@@ -130,6 +196,36 @@ class Testing(unittest.TestCase):
         self.assertEqual('abc', utils.strip('abc'))
         self.assertEqual('abc', utils.strip('{https:////}{{{{}}}}abc'))
 
+    def test_numpy_dtype(self):
+        self.assertEqual(utils.numpy_dtype('double'), np.float64)
+        self.assertEqual(utils.numpy_dtype('FLOAT'), np.float32)
+        self.assertEqual(utils.numpy_dtype('float32'), np.float32)
+        self.assertEqual(utils.numpy_dtype('int16'), np.int16)
+        self.assertEqual(utils.numpy_dtype('UINT8'), np.uint8)
+        with self.assertRaises(AssertionError):
+            utils.numpy_dtype('complex')
+
+    def test_lru_cache(self):
+        cache = utils.LRUCache(max_bytes=100)
+        cache.put('a', 1, 40)
+        cache.put('b', 2, 40)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3, 40)  # evicts b, as a was used more recently
+        self.assertNotIn('b', cache)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('d', 'default'), 'default')
+        cache.put('e', 4, 101)  # larger than the cache
+        self.assertNotIn('e', cache)
+        self.assertEqual(cache.info(), {'hits': 1, 'misses': 2, 'evictions': 1,
+                                        'items': 2, 'n_bytes': 80, 'max_bytes': 100})
+        cache.remove(lambda key: key == 'a')
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.n_bytes, 40)
+
+        copy = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(copy.max_bytes, 100)
+        self.assertEqual(len(copy), 0)
+
     def test_str2num(self):
         self.assertEqual(utils.str2num('200_26747'), '200_26747')  # due to PEP-515
         self.assertEqual(utils.str2num('20026747'), 20026747)
@@ -141,6 +237,31 @@ class Testing(unittest.TestCase):
         self.assertEqual(utils.str2num('20,026747', ','), 20.026747)
         self.assertEqual(utils.str2num('20,02,6747', ','), '20,02,6747')
 
+    def test_str2num_column(self):
+        columns = [['1', '20', '007'],
+                   ['1', '2.5', '-3', 'nan', '1e10'],
+                   ['True', 'False', 'True'],
+                   ['True', '1', 'a'],
+                   ['1', '200_26747', '2.5'],
+                   ['99999999999999999999', '1'],
+                   ['a', 'b', ''],
+                   ['1,5', '2', 's1,5'],
+                   []]
+        for column in columns:
+            for decimal_sep in ['.', ',']:
+                expected = [utils.str2num(x, decimal_sep) for x in column]
+                converted = utils.str2num_column(column, decimal_sep)
+                # repr, as nan != nan and 1 == 1.0 == True
+                self.assertEqual([repr(x) for x in converted],
+                                 [repr(x) for x in expected])
+
+        # ragged lines are converted per column as well
+        file = os.path.join(self.tmpdir, 'ragged.csv')
+        with open(file, 'w') as f:
+            f.write('1;a;2.5\n2;b\n3;c;True\n')
+        read = utils.read_csv(file, convert_nums=True)
+        self.assertEqual(read, [[1, 'a', 2.5], [2, 'b'], [3, 'c', True]])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,2 +1,4 @@
 from .entry import *
 from .main import Unisens
+from .catalog import Catalog
+from .batch import convert_folders
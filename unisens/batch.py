@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+"""
+Apply a conversion to many Unisens recordings at once, e.g. to convert
+csv signals to binary files for a whole archive.
+
+Each recording is converted in a copy of its folder, which replaces
+the original folder only if the conversion succeeded. A marker file
+is written into the converted folder, such that an interrupted job
+continues where it stopped when it is started again.
+
+Example:
+    from unisens.batch import convert_folders, csv_to_bin
+    result = convert_folders('/data/recordings', csv_to_bin, n_workers=8)
+    print(result['failed'])
+
+or from the command line:
+    unisens-convert /data/recordings csv2bin --workers 8
+"""
+import os
+import re
+import sys
+import shutil
+import logging
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .main import Unisens
+from .entry import SignalEntry
+from .utils import write_atomic
+
+logger = logging.getLogger("unisens")
+
+
+def csv_to_bin(u: Unisens):
+    """converts all csv SignalEntries to binary files"""
+    for entry in [e for e in u._entries if isinstance(e, SignalEntry)]:
+        if not entry.id.endswith('.csv'):
+            continue
+        data = np.atleast_2d(entry.get_data(scaled=False))
+        channels = entry.channel if isinstance(entry.channel, list) else [entry.channel]
+        ch_names = [channel.attrib.get('name') for channel in channels]
+        attrib = {key: value for key, value in entry.attrib.items() if key != 'id'}
+        u.remove_entry(entry.id)
+        os.remove(entry._filename)
+        SignalEntry(entry.id[:-4] + '.bin', parent=u).set_data(data, ch_names=ch_names,
+                                                               **attrib)
+
+
+def to_int16(u: Unisens):
+    """
+    converts float SignalEntries to int16, the lsbValue is chosen
+    such that the largest value uses the full range of int16
+    """
+    for entry in [e for e in u._entries if isinstance(e, SignalEntry)]:
+        if not entry.id.endswith('.bin') or entry.dataType not in ('float', 'double'):
+            continue
+        data = entry.get_data()
+        peak = np.nanmax(np.abs(data)) if data.size else 0
+        lsbValue = float(peak / 32767) if peak else 1.0
+        if 'baseline' in entry.attrib:
+            entry.remove_attr('baseline')
+        entry.set_data(np.round(data / lsbValue), dataType='int16', lsbValue=lsbValue)
+
+
+def to_planar(u: Unisens):
+    """saves all binary SignalEntries with planar layout"""
+    for entry in [e for e in u._entries if isinstance(e, SignalEntry)]:
+        if entry.id.endswith('.bin') and entry._bin_layout() != 'planar':
+            entry.set_data(entry.get_data(scaled=False), layout='planar')
+
+
+def to_interleaved(u: Unisens):
+    """saves all binary SignalEntries uncompressed with interleaved layout"""
+    for entry in [e for e in u._entries if isinstance(e, SignalEntry)]:
+        if entry.id.endswith('.bin') and \
+                (entry._bin_layout() != 'interleaved' or entry._compression()):
+            entry.set_data(entry.get_data(scaled=False), layout='interleaved')
+
+
+# the conversions that can be selected on the command line
+conversions = {'csv2bin': csv_to_bin,
+               'int16': to_int16,
+               'planar': to_planar,
+               'interleaved': to_interleaved}
+
+
+def _paths(folder: str, name: str):
+    """the status marker, the staging and the backup folder of a recording"""
+    folder = os.path.normpath(folder)
+    return (os.path.join(folder, f'.batch_{name}.done'),
+            f'{folder}.batch_{name}.tmp',
+            f'{folder}.batch_{name}.bak')
+
+
+def _recover(folder: str, name: str):
+    """
+    Finishes or rolls back the replacement of a folder that
+    was interrupted, and removes unfinished conversions.
+    """
+    _, staging, backup = _paths(folder, name)
+    if not os.path.isdir(folder) and os.path.isdir(backup):
+        if os.path.isfile(_paths(staging, name)[0]):
+            os.rename(staging, folder)  # the conversion was complete
+        else:
+            os.rename(backup, folder)
+    if os.path.isdir(backup):
+        shutil.rmtree(backup)
+    if os.path.isdir(staging):
+        shutil.rmtree(staging)
+
+
+def _convert_folder(folder: str, func, name: str, filename: str = 'unisens.xml'):
+    """
+    Converts one recording in a copy of its folder, which then
+    replaces the original folder.
+    """
+    _, staging, backup = _paths(folder, name)
+    shutil.copytree(folder, staging)
+    try:
+        u = Unisens(staging, filename=filename)
+        func(u)
+        u.save(filename=filename)
+        write_atomic(_paths(staging, name)[0], func.__module__.encode() +
+                     b'.' + func.__name__.encode())
+    except BaseException:
+        shutil.rmtree(staging)
+        raise
+    os.rename(folder, backup)
+    os.rename(staging, folder)
+    shutil.rmtree(backup)
+
+
+# the staging and backup folders of _paths, the group is the name of the job
+_job_folder = re.compile(r'\.batch_(.+)\.(tmp|bak)$')
+
+
+def _find_folders(root: str, filename: str = 'unisens.xml') -> list:
+    """
+    all folders below root that contain a unisens.xml. Staging and backup
+    folders of interrupted jobs are not returned, instead the replacement
+    of their recording is finished or rolled back with _recover.
+    """
+    found, interrupted = set(), set()
+    for folder, subfolders, files in os.walk(root):
+        for subfolder in list(subfolders):
+            match = _job_folder.search(subfolder)
+            if match:
+                subfolders.remove(subfolder)
+                original = os.path.join(folder, subfolder[:match.start()])
+                interrupted.add((original, match.group(1)))
+        if filename in files:
+            found.add(folder)
+    for original, name in sorted(interrupted):
+        _recover(original, name)
+        if os.path.isfile(os.path.join(original, filename)):
+            found.add(original)
+    return sorted(found)
+
+
+def convert_folders(folders, func, n_workers: int = None, name: str = None,
+                    resume: bool = True, progress=None,
+                    filename: str = 'unisens.xml') -> dict:
+    """
+    Applies a conversion to many recordings in a pool of processes.
+    Every recording is converted in a copy of its folder, which replaces
+    the original folder only after the conversion has finished. If the
+    conversion fails, the original folder is not changed.
+
+    :param folders: a list of folders, or a folder that is searched for recordings
+    :param func: a function that receives the Unisens object of a recording
+                 and changes it, e.g. csv_to_bin. It must be defined at the
+                 top level of a module, such that it can be sent to
+                 other processes. The Unisens object is saved afterwards.
+    :param n_workers: the number of processes. n_workers=1 converts in the
+                      current process. The default is the number of CPUs.
+    :param name: the name of the job for the status markers,
+                 the default is the name of `func`
+    :param resume: skip recordings that were already converted by this job
+    :param progress: a function progress(n_done, n_total, folder, status)
+                     that is called after every recording. status is
+                     'converted', 'skipped' or 'failed'.
+    :param filename: the name of the unisens.xml
+    :returns: a dict with the lists of 'converted' and 'skipped' folders
+              and a dict 'failed' with the errors of failed folders
+    """
+    if isinstance(folders, str):
+        folders = _find_folders(folders, filename)
+    folders = [os.path.normpath(os.path.abspath(folder)) for folder in folders]
+    name = name or func.__name__
+    result = {'converted': [], 'skipped': [], 'failed': {}}
+    n_total = len(folders)
+
+    def report(folder, status):
+        n_done = len(result['converted']) + len(result['skipped']) + len(result['failed'])
+        logger.info(f'[{n_done}/{n_total}] {status} {folder}')
+        if progress is not None:
+            progress(n_done, n_total, folder, status)
+
+    todo = []
+    for folder in folders:
+        _recover(folder, name)
+        if resume and os.path.isfile(_paths(folder, name)[0]):
+            result['skipped'].append(folder)
+            report(folder, 'skipped')
+        else:
+            todo.append(folder)
+
+    def done(folder, error=None):
+        if error is None:
+            result['converted'].append(folder)
+            report(folder, 'converted')
+        else:
+            result['failed'][folder] = error
+            logger.warning(f'Can\'t convert {folder}: {error}')
+            report(folder, 'failed')
+
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers == 1 or len(todo) < 2:
+        for folder in todo:
+            try:
+                _convert_folder(folder, func, name, filename)
+            except Exception as e:
+                done(folder, f'{type(e).__name__}: {e}')
+            else:
+                done(folder)
+        return result
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        futures = {executor.submit(_convert_folder, folder, func, name, filename): folder
+                   for folder in todo}
+        for future in as_completed(futures):
+            error = future.exception()
+            done(futures[future], None if error is None
+                 else f'{type(error).__name__}: {error}')
+    return result
+
+
+def _load_function(conversion: str):
+    """a conversion of this module or a function given as module:function"""
+    if conversion in conversions:
+        return conversions[conversion]
+    if ':' not in conversion:
+        raise ValueError(f'Unknown conversion {conversion}, use one of '
+                         f'{list(conversions)} or module:function')
+    module, function = conversion.split(':', 1)
+    return getattr(importlib.import_module(module), function)
+
+
+def main(argv: list = None) -> int:
+    """the command line interface unisens-convert"""
+    parser = argparse.ArgumentParser(
+        prog='unisens-convert',
+        description='Apply a conversion to all Unisens recordings in a folder.')
+    parser.add_argument('root', help='folder that is searched for recordings')
+    parser.add_argument('conversion', help=f'one of {list(conversions)} or '
+                                           'module:function')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='number of processes, default the number of CPUs')
+    parser.add_argument('--name', default=None,
+                        help='name of the job for the status markers')
+    parser.add_argument('--no-resume', action='store_true',
+                        help='convert recordings again that were already converted')
+    parser.add_argument('--filename', default='unisens.xml',
+                        help='name of the unisens.xml')
+    args = parser.parse_args(argv)
+
+    func = _load_function(args.conversion)
+
+    def progress(n_done, n_total, folder, status):
+        print(f'[{n_done}/{n_total}] {status} {folder}', file=sys.stderr)
+
+    result = convert_folders(args.root, func, n_workers=args.workers, name=args.name,
+                             resume=not args.no_resume, progress=progress,
+                             filename=args.filename)
+    for folder, error in result['failed'].items():
+        print(f'failed {folder}: {error}', file=sys.stderr)
+    print(f'{len(result["converted"])} converted, {len(result["skipped"])} skipped, '
+          f'{len(result["failed"])} failed')
+    return 1 if result['failed'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+"""
+A catalog of many Unisens recordings. The headers (unisens.xml) of all
+recordings in a directory tree are indexed in a SQLite database, such
+that recordings and entries can be found without loading every folder.
+
+Example:
+    with Catalog('catalog.sqlite') as catalog:
+        catalog.scan('/data/recordings')
+        folders = catalog.find_recordings(measurementId='patient_01')
+        entries = catalog.find_entries(entry_type='signalEntry',
+                                       contentClass='ECG',
+                                       sampleRate=(200, 1000))
+"""
+import os
+import logging
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+from .main import Unisens
+from .entry import CustomAttributes
+
+logger = logging.getLogger("unisens")
+
+_schema = """
+CREATE TABLE IF NOT EXISTS recordings (
+    folder TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    mtime INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS recording_attrib (
+    folder TEXT NOT NULL REFERENCES recordings(folder) ON DELETE CASCADE,
+    key TEXT NOT NULL,
+    value TEXT,
+    number REAL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    folder TEXT NOT NULL REFERENCES recordings(folder) ON DELETE CASCADE,
+    entry_id TEXT NOT NULL,
+    entry_type TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entry_attrib (
+    folder TEXT NOT NULL REFERENCES recordings(folder) ON DELETE CASCADE,
+    entry_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    number REAL
+);
+CREATE INDEX IF NOT EXISTS recording_attrib_key ON recording_attrib(key, value);
+CREATE INDEX IF NOT EXISTS recording_attrib_number ON recording_attrib(key, number);
+CREATE INDEX IF NOT EXISTS recording_attrib_folder ON recording_attrib(folder);
+CREATE INDEX IF NOT EXISTS entries_folder ON entries(folder, entry_id);
+CREATE INDEX IF NOT EXISTS entry_attrib_key ON entry_attrib(key, value);
+CREATE INDEX IF NOT EXISTS entry_attrib_number ON entry_attrib(key, number);
+CREATE INDEX IF NOT EXISTS entry_attrib_entry ON entry_attrib(folder, entry_id);
+"""
+
+# increased when the schema changes, older catalogs are created anew
+_schema_version = 1
+
+
+def _number(value: str):
+    """the value as float for range queries, None if it is not a number"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if number != number else number  # NaN
+
+
+def _read_header(folder: str, filename: str = 'unisens.xml') -> dict:
+    """
+    Parses the unisens.xml of a folder without accessing the data files.
+
+    :param folder: the folder of the recording
+    :param filename: the name of the unisens.xml
+    :returns: a dictionary with the attributes and entries of the recording
+    """
+    u = Unisens(folder, filename=filename, readonly=True, lazy=True)
+    attrib = {key: str(value) for key, value in u.attrib.items()}
+    entries = []
+    for entry in u._entries:
+        entry_attrib = {key: str(value) for key, value in entry.attrib.items()}
+        if isinstance(entry, CustomAttributes):
+            # custom attributes describe the recording, e.g. the patient age
+            for key, value in entry_attrib.items():
+                attrib.setdefault(key, value)
+            continue
+        entry_id = entry_attrib.get('id', entry._name)
+        entries.append((entry_id, entry._name, entry_attrib))
+    return {'attrib': attrib, 'entries': entries}
+
+
+def _stat_header(file: str):
+    stat = os.stat(file)
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Catalog():
+    """
+    An index of the unisens.xml headers of many recordings, stored
+    in a SQLite database. The index is updated incrementally by scan(),
+    only headers that were changed since the last scan are parsed again.
+
+    All attributes are stored as strings, as they are saved in the XML.
+    Queries can compare numbers by giving a range as tuple (min, max),
+    attributes that are not numbers never match a range.
+    """
+
+    def __init__(self, db_file: str = ':memory:', filename: str = 'unisens.xml'):
+        """
+        :param db_file: the SQLite file of the catalog. It will be
+                        created if it does not exist. The default is
+                        to keep the catalog in memory only.
+        :param filename: the name of the headers that are indexed
+        """
+        self.db_file = db_file
+        self.filename = filename
+        self._db = sqlite3.connect(db_file)
+        self._db.execute('PRAGMA foreign_keys = ON')
+        version = self._db.execute('PRAGMA user_version').fetchone()[0]
+        if version != _schema_version:
+            with self._db:
+                for table in ('entry_attrib', 'entries', 'recording_attrib', 'recordings'):
+                    self._db.execute(f'DROP TABLE IF EXISTS {table}')
+        self._db.executescript(_schema)
+        self._db.execute(f'PRAGMA user_version = {_schema_version}')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self._db.execute('SELECT COUNT(*) FROM recordings').fetchone()[0]
+
+    def __contains__(self, folder: str):
+        folder = os.path.abspath(folder)
+        row = self._db.execute('SELECT 1 FROM recordings WHERE folder=?',
+                               (folder,)).fetchone()
+        return row is not None
+
+    def __repr__(self):
+        return f'Catalog({self.db_file}, {len(self)} recordings)'
+
+    def close(self):
+        """Close the database connection."""
+        self._db.close()
+
+    def _find_headers(self, root: str) -> dict:
+        """
+        Walk the directory tree and find all headers with their mtime and size
+        """
+        headers = {}
+        for folder, dirs, files in os.walk(root):
+            if self.filename in files:
+                file = os.path.join(folder, self.filename)
+                try:
+                    headers[folder] = _stat_header(file)
+                except OSError:
+                    continue
+        return headers
+
+    def scan(self, root: str, n_workers: int = None) -> dict:
+        """
+        Index all recordings in a directory tree. Recordings that have
+        not been changed since the last scan are not parsed again and
+        recordings that no longer exist are removed from the catalog.
+
+        :param root: the directory that is searched for recordings
+        :param n_workers: number of processes that parse the headers.
+                          n_workers=1 parses in the current process.
+                          The default is the number of CPUs.
+        :returns: a dict with the number of 'added', 'updated',
+                  'removed' and 'failed' recordings
+        """
+        root = os.path.abspath(root)
+        headers = self._find_headers(root)
+
+        prefix = os.path.join(root, '')
+        indexed = self._db.execute('SELECT folder, mtime, size FROM recordings '
+                                   'WHERE folder = ? OR substr(folder, 1, ?) = ?',
+                                   (root, len(prefix), prefix))
+        indexed = {folder: (mtime, size) for folder, mtime, size in indexed}
+        removed = [folder for folder in indexed if folder not in headers]
+        changed = [folder for folder, stat in headers.items()
+                   if indexed.get(folder) != stat]
+
+        filenames = [self.filename] * len(changed)
+        n_workers = n_workers or os.cpu_count() or 1
+        executor = None
+        if n_workers == 1 or len(changed) < 2:
+            results = map(self._try_read_header, changed, filenames)
+        else:
+            executor = ProcessPoolExecutor(max_workers=n_workers)
+            chunksize = max(1, len(changed) // (4 * n_workers))
+            results = executor.map(Catalog._try_read_header, changed, filenames,
+                                   chunksize=chunksize)
+
+        stats = {'added': 0, 'updated': 0, 'removed': len(removed), 'failed': 0}
+        try:
+            with self._db:
+                self._db.executemany('DELETE FROM recordings WHERE folder=?',
+                                     [(folder,) for folder in removed])
+                for folder, header in zip(changed, results):
+                    if header is None:
+                        stats['failed'] += 1
+                        continue
+                    stats['updated' if folder in indexed else 'added'] += 1
+                    self._insert(folder, headers[folder], header)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return stats
+
+    @staticmethod
+    def _try_read_header(folder: str, filename: str):
+        try:
+            return _read_header(folder, filename)
+        except Exception as e:
+            logger.warning(f'Can\'t read {os.path.join(folder, filename)}: {e}')
+            return None
+
+    def _insert(self, folder: str, stat: tuple, header: dict):
+        """Replace the recording `folder` in the database"""
+        self._db.execute('DELETE FROM recordings WHERE folder=?', (folder,))
+        self._db.execute('INSERT INTO recordings VALUES (?, ?, ?, ?)',
+                         (folder, self.filename, *stat))
+        self._db.executemany('INSERT INTO recording_attrib VALUES (?, ?, ?, ?)',
+                             [(folder, key, value, _number(value)) for key, value
+                              in header['attrib'].items()])
+        self._db.executemany('INSERT INTO entries VALUES (?, ?, ?)',
+                             [(folder, entry_id, entry_type) for entry_id, entry_type, _
+                              in header['entries']])
+        self._db.executemany('INSERT INTO entry_attrib VALUES (?, ?, ?, ?, ?)',
+                             [(folder, entry_id, key, value, _number(value))
+                              for entry_id, _, attrib in header['entries']
+                              for key, value in attrib.items()])
+
+    @staticmethod
+    def _conditions(table: str, columns: str, attrib: dict):
+        """
+        Create SQL conditions that all attributes in `attrib` match.
+        A tuple (min, max) matches numbers in this range, None means
+        no limit. Attributes that are not numbers never match a range.
+        Any other value must be equal to the attribute.
+        """
+        conditions, params = [], []
+        for key, value in attrib.items():
+            if isinstance(value, tuple):
+                low, high = value
+                condition = 'a.number BETWEEN ? AND ?'
+                params.extend([key, float('-inf') if low is None else low,
+                               float('inf') if high is None else high])
+            else:
+                condition = 'a.value = ?'
+                params.extend([key, str(value)])
+            conditions.append(f'EXISTS (SELECT 1 FROM {table} a WHERE '
+                              f'({columns}) AND a.key = ? AND {condition})')
+        return conditions, params
+
+    def find_recordings(self, **attrib) -> list:
+        """
+        Find all recordings with the given attributes. Custom attributes
+        of the recording can be queried in the same way.
+
+        Example:
+            catalog.find_recordings(measurementId='patient_01')
+            catalog.find_recordings(duration=(3600, None))
+
+        :param attrib: attributes that must match, e.g. measurementId='01'.
+                       use a tuple (min, max) to find a range of numbers
+        :returns: a sorted list of folders
+        """
+        conditions, params = self._conditions('recording_attrib',
+                                              'a.folder = r.folder', attrib)
+        where = ' AND '.join(conditions) or '1'
+        rows = self._db.execute(f'SELECT r.folder FROM recordings r '
+                                f'WHERE {where} ORDER BY r.folder', params)
+        return [folder for folder, in rows]
+
+    def find_entries(self, entry_type: str = None, **attrib) -> list:
+        """
+        Find all entries with the given attributes in all recordings.
+
+        Example:
+            catalog.find_entries(entry_type='signalEntry', contentClass='ECG')
+            catalog.find_entries(sampleRate=(256, None))
+
+        :param entry_type: the type of the entries, e.g. 'signalEntry'
+        :param attrib: attributes that must match, e.g. contentClass='ECG'.
+                       use a tuple (min, max) to find a range of numbers
+        :returns: a sorted list of tuples (folder, entry id)
+        """
+        conditions, params = self._conditions(
+            'entry_attrib', 'a.folder = e.folder AND a.entry_id = e.entry_id', attrib)
+        if entry_type is not None:
+            conditions.insert(0, 'e.entry_type = ?')
+            params.insert(0, entry_type)
+        where = ' AND '.join(conditions) or '1'
+        rows = self._db.execute(f'SELECT e.folder, e.entry_id FROM entries e '
+                                f'WHERE {where} ORDER BY e.folder, e.entry_id',
+                                params)
+        return rows.fetchall()
+
+    def get_attrib(self, folder: str, entry_id: str = None) -> dict:
+        """
+        Get the indexed attributes of a recording or one of its entries
+
+        :param folder: the folder of the recording
+        :param entry_id: the id of an entry. if None, the attributes
+                         of the recording are returned.
+        :returns: a dictionary with the attributes as strings
+        """
+        folder = os.path.abspath(folder)
+        if folder not in self:
+            raise KeyError(f'{folder} is not in the catalog')
+        if entry_id is None:
+            rows = self._db.execute('SELECT key, value FROM recording_attrib '
+                                    'WHERE folder=?', (folder,))
+        else:
+            rows = self._db.execute('SELECT key, value FROM entry_attrib '
+                                    'WHERE folder=? AND entry_id=?',
+                                    (folder, entry_id))
+        return dict(rows)
+
+    def get_entries(self, folder: str) -> list:
+        """
+        :param folder: the folder of the recording
+        :returns: a list of tuples (entry id, entry type) of the recording
+        """
+        folder = os.path.abspath(folder)
+        rows = self._db.execute('SELECT entry_id, entry_type FROM entries '
+                                'WHERE folder=? ORDER BY rowid', (folder,))
+        return rows.fetchall()
+
+    def load(self, folder: str, **kwargs) -> Unisens:
+        """
+        Open a recording of the catalog
+
+        :param folder: the folder of the recording
+        :param kwargs: passed to Unisens, e.g. readonly=True
+        :returns: the Unisens object
+        """
+        folder = os.path.abspath(folder)
+        row = self._db.execute('SELECT filename FROM recordings WHERE folder=?',
+                               (folder,)).fetchone()
+        if row is None:
+            raise KeyError(f'{folder} is not in the catalog')
+        return Unisens(folder, filename=row[0], **kwargs)
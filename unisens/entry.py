@@ -6,12 +6,17 @@ Created on Mon Jan 6 21:16:58 2020
 """
 from __future__ import annotations
 
+import functools
 import importlib
 import logging
+import lzma
 import os
 import sys
 import warnings
+import zlib
 from abc import ABC
+from fractions import Fraction
+from contextlib import nullcontext
 from copy import deepcopy
 from typing import List, Tuple
 from xml.etree import ElementTree as ET
@@ -20,10 +25,15 @@ from xml.etree.ElementTree import Element
 import numpy as np
 
 from .utils import (
+    AttrDict,
     infer_dtype,
     lowercase,
     make_key,
+    num2str,
+    numpy_dtype,
     read_csv,
+    read_csv_structured,
+    str2num,
     strip,
     valid_filename,
     validkey,
@@ -42,6 +52,134 @@ def get_module(name):
         raise Exception(f'Cant load module {name}')
 
 
+def get_codec(name: str):
+    """
+    Returns the functions (compress, decompress) of a compression codec.
+    zlib and lzma are always available, zstd needs `zstandard` installed.
+
+    :param name: 'zlib', 'lzma' or 'zstd'
+    """
+    name = name.lower()
+    if name == 'zlib':
+        return zlib.compress, zlib.decompress
+    if name == 'lzma':
+        return lzma.compress, lzma.decompress
+    if name == 'zstd':
+        zstandard = get_module('zstandard')
+        return zstandard.ZstdCompressor().compress, \
+            zstandard.ZstdDecompressor().decompress
+    raise ValueError(f'Unknown compression {name}, use zlib, lzma or zstd')
+
+
+def batched(func):
+    """
+    Decorator that runs a method of an Entry inside `Entry.batch()`,
+    such that all changes it makes are autosaved only once at the end.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.batch():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def _hashable(value):
+    """converts lists in function arguments to tuples, e.g. channels"""
+    if isinstance(value, (list, tuple)):
+        return tuple(_hashable(v) for v in value)
+    return value
+
+
+def _n_bytes(data):
+    """
+    the memory used by data that can be cached, else None. The size of
+    lists, tuples and dicts is estimated from their items, e.g. the rows
+    of a csv file, pandas DataFrames report their own memory usage.
+    """
+    if isinstance(data, np.memmap):
+        return None
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, (bytes, str)):
+        return len(data)
+    if data is None or isinstance(data, (bool, int, float, complex, np.generic)):
+        return sys.getsizeof(data)
+    if isinstance(data, (list, tuple, dict)):
+        items = [x for item in data.items() for x in item] \
+            if isinstance(data, dict) else data
+        n_bytes = sys.getsizeof(data)
+        for item in items:
+            n_item = _n_bytes(item)
+            if n_item is None:
+                return None
+            n_bytes += n_item
+        return n_bytes
+    if hasattr(data, 'memory_usage') and hasattr(data, 'copy'):
+        return int(data.memory_usage(deep=True).sum())  # pandas
+    return None
+
+
+def _copy_cached(data):
+    """
+    Arrays are cached read-only, strings and bytes can't be changed.
+    Everything else is copied, such that the cached value can't be changed.
+    """
+    if isinstance(data, (np.ndarray, bytes, str)):
+        return data
+    return deepcopy(data)
+
+
+_missing = object()
+
+
+def cached(func):
+    """
+    Decorator for get_data of FileEntries. If the uppermost Unisens object
+    has a cache, the results are stored there, using the id, the mtime
+    and size of the file, the attributes of the entry and its sub-entries
+    (e.g. lsbValue and binFileFormat) and the arguments as key. Numpy arrays
+    are made read-only. Lists, dicts and DataFrames, e.g. of csv files, are
+    cached as well, but a copy is returned on every call.
+    Other objects, e.g. memory maps, are not cached.
+    """
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        cache = self._get_cache()
+        if cache is None or kwargs.get('out') is not None:
+            return func(self, *args, **kwargs)
+        try:
+            stat = os.stat(self._filename)
+            key = (self.id, func.__qualname__, stat.st_mtime_ns, stat.st_size,
+                   self._cache_state(), _hashable(args),
+                   _hashable(sorted(kwargs.items())))
+            hash(key)
+        except (OSError, TypeError):
+            return func(self, *args, **kwargs)
+        data = cache.get(key, _missing)
+        if data is not _missing:
+            return _copy_cached(data)
+        data = func(self, *args, **kwargs)
+        n_bytes = _n_bytes(data)
+        if n_bytes is not None:
+            if isinstance(data, np.ndarray):
+                data.flags.writeable = False
+            cache.put(key, _copy_cached(data), n_bytes)
+        return data
+    return wrapper
+
+
+# entries with these names exist only once, adding a new one replaces the old
+_reserved_names = ('binFileFormat', 'csvFileFormat', 'customFileFormat', 'pyramid')
+
+
+@functools.lru_cache(maxsize=None)
+def _class_names(cls) -> frozenset:
+    """the names of all methods and class attributes of `cls`"""
+    return frozenset(dir(cls))
+
+
 class Entry(ABC):
     """
     Base class for Unisens entries. All other entries inherit from this.
@@ -75,7 +213,12 @@ class Entry(ABC):
 
         if attrib is None:
             attrib = dict()
-        self.__dict__['attrib'] = deepcopy(attrib)
+        # attributes read from XML are strings, a shallow copy is enough
+        if all(isinstance(v, (str, int, float, bool)) for v in attrib.values()):
+            attrib = attrib.copy()
+        else:
+            attrib = deepcopy(attrib)
+        self.__dict__['attrib'] = attrib
         self.__dict__.update(self.attrib)
         self.__dict__['_entries'] = []
         self.__dict__['_folder'] = parent.__dict__['_folder'] if isinstance(parent, Entry) else parent
@@ -85,6 +228,52 @@ class Entry(ABC):
             self.set_attrib(key, kwargs[key])
         self._autosave()
 
+    @classmethod
+    def _from_xml(cls, attrib: dict, folder: str, lazy: bool = False,
+                  name: str = None) -> Entry:
+        """
+        Creates an Entry from the attributes of an XML element without
+        calling __init__, which is much faster for large headers.
+        The result is the same as calling cls(attrib=attrib, parent=folder).
+        Sub-entries are added afterwards with _append_entry.
+
+        :param attrib: the attributes of the element, they are not copied
+        :param folder: the folder of the Unisens object
+        :param lazy: don't check that the file of a FileEntry exists
+        :param name: the name of the entry, the default is the class name
+        """
+        entry = cls.__new__(cls)
+        d = entry.__dict__
+        d['attrib'] = attrib
+        d.update(attrib)
+        d['_entries'] = []
+        d['_folder'] = folder
+        d['_parent'] = None
+        d['_name'] = name or lowercase(cls.__name__)
+        return entry
+
+    def _append_entry(self, entry: Entry):
+        """
+        Adds a sub-entry in the same way as add_entry, but without
+        autosaving. Used to build the entries when reading a unisens.xml.
+        """
+        d = self.__dict__
+        name = make_key(entry.attrib.get('id', entry.__dict__['_name']))
+        if entry._name in _reserved_names and isinstance(d.get(name), Entry):
+            self._entries.remove(d.pop(name))
+            d['_lookup'] = None
+        if name in d:
+            # stack entries with the same name inside a list
+            if not isinstance(d[name], list):
+                d[name] = [d[name]]
+            d[name].append(entry)
+        else:
+            d[name] = entry
+        self._entries.append(entry)
+        if d.get('_lookup') is not None:
+            self._add_lookup(d['_lookup'], len(self._entries) - 1, entry)
+        entry.__dict__['_parent'] = self
+
     def __contains__(self, item):
         if item in self.__dict__:
             return True
@@ -103,7 +292,7 @@ class Entry(ABC):
         super.__setattr__(self, name, value)
         if name.startswith('_'):
             return
-        methods = dir(type(self))
+        methods = _class_names(type(self))
         # do not overwrite if it's a builtin method
         if name not in methods and \
                 isinstance(value, (int, float, bool, bytes, str)):
@@ -141,6 +330,49 @@ class Entry(ABC):
         if self._parent is not None:
             self._parent._autosave()
 
+    def _root(self) -> Entry:
+        """the uppermost parent of this Entry, usually the Unisens object"""
+        root = self
+        while root.__dict__.get('_parent') is not None:
+            root = root._parent
+        return root
+
+    def _get_cache(self):
+        """the data cache of the uppermost parent, if enabled"""
+        cache = self._root().__dict__.get('_cache')
+        if cache is None or not cache.max_bytes:
+            return None
+        return cache
+
+    def _cache_state(self) -> tuple:
+        """
+        the attributes of this entry and all sub-entries, which
+        determine how the data is read, e.g. lsbValue or channels
+        """
+        attrib = tuple(sorted((key, str(value)) for key, value in self.attrib.items()))
+        return attrib, tuple(entry._cache_state() for entry in self._entries)
+
+    def _invalidate_cache(self):
+        """remove the cached data of this entry, e.g. after writing new data"""
+        cache = self._get_cache()
+        if cache is not None:
+            cache.remove(lambda key: key[0] == self.id)
+
+    def batch(self):
+        """
+        Returns a context manager in which changes to the uppermost
+        Unisens object are not autosaved one by one, but only once
+        at the end. If this Entry has no parent, nothing happens.
+
+        Example:
+            with entry.batch():
+                entry.set_attrib('unit', 'mV')
+                entry.set_attrib('comment', 'ECG')
+        """
+        if self.__dict__.get('_parent') is not None:
+            return self._parent.batch()
+        return nullcontext(self)
+
     def _check_readonly(self):
         """
         will raise an exception if a write operation 
@@ -176,45 +408,58 @@ class Entry(ABC):
             key: str, key-name in __dict__, not id/_name in entry
         """
 
-        id_or_name_key_upper = make_key(id_or_name).upper()
+        exact, partial = self._get_lookup()
 
         # we don't care about case, gently ignoring Linux file case-sensitivity
         # first check for exact match
-        for i, entry in enumerate(self._entries):
-            if hasattr(entry, 'id'):
-                id_key = make_key(entry.id)
-                if id_key.upper() == id_or_name_key_upper:
-                    return i, id_key  # check for match in key notation
-            else:
-                name = entry._name
-                name_key = make_key(name)
-                if name_key.upper() == id_or_name_key_upper:
-                    return i, name
-
-        id_or_name_upper = id_or_name.upper()
-        found = []
-        for i, entry in enumerate(self._entries):
-            if hasattr(entry, 'id'):
-                id_upper = entry.id.upper()
-                no_ext = id_upper.rsplit('.', 1)[0]  # remove file extension
-                # check if file without extension was requested
-                # e.g. 'test' for test.txt
-                if no_ext == id_or_name_upper:
-                    found += [(i, make_key(entry.id))]
-                elif '/' in id_upper or '\\' in id_upper:  # remove subdirectories
-                    # e.g. 'test' was requested for 'sub/test.txt'
-                    if os.path.basename(no_ext) == id_or_name_upper:
-                        found += [(i, make_key(entry.id))]
-                    # e.g. 'test.txt' was requested for 'sub/test.txt'
-                    elif os.path.basename(id_upper) == id_or_name_upper:
-                        found += [(i, make_key(entry.id))]
+        match = exact.get(make_key(id_or_name).upper())
+        if match is not None:
+            return match
 
+        found = partial.get(id_or_name.upper(), [])
         if len(found) == 1:
             return found[0]
         if len(found) > 1:
             raise IndexError(f'More than one match for {id_or_name}: {found}')
         raise KeyError(f'{id_or_name} not found')
 
+    def _get_lookup(self) -> Tuple[dict, dict]:
+        """
+        Returns the lookup tables used by _get_index, building them if needed.
+
+        `exact` maps the upper-case key of each sub-entry to its index and
+        key-name, `partial` maps the upper-case id without extension and
+        without subdirectories to a list of matching (index, key-name).
+        The tables are extended in add_entry and reset on removal.
+        """
+        lookup = self.__dict__.get('_lookup')
+        if lookup is None:
+            lookup = ({}, {})
+            for i, entry in enumerate(self._entries):
+                self._add_lookup(lookup, i, entry)
+            self.__dict__['_lookup'] = lookup
+        return lookup
+
+    @staticmethod
+    def _add_lookup(lookup: Tuple[dict, dict], i: int, entry: Entry):
+        """adds the sub-entry at index i to the lookup tables"""
+        exact, partial = lookup
+        if 'id' in entry.__dict__:
+            id_key = make_key(entry.id)
+            exact.setdefault(id_key.upper(), (i, id_key))  # match in key notation
+            id_upper = entry.id.upper()
+            no_ext = id_upper.rsplit('.', 1)[0]  # remove file extension
+            # e.g. 'test' for test.txt
+            names = {no_ext}
+            if '/' in id_upper or '\\' in id_upper:  # remove subdirectories
+                # e.g. 'test' or 'test.txt' was requested for 'sub/test.txt'
+                names.update([os.path.basename(no_ext), os.path.basename(id_upper)])
+            for name in names:
+                partial.setdefault(name, []).append((i, id_key))
+        else:
+            name = entry._name
+            exact.setdefault(make_key(name).upper(), (i, name))
+
     def _set_channels(self, ch_names: List[str], n_data: int):
         """
         Checks existing channel attributes.
@@ -301,12 +546,10 @@ class Entry(ABC):
         """
         # there are several Entries that have reserved names.
         # these should not exist double, therefore they are re-set here
-        reserved = ['binFileFormat', 'csvFileFormat', 'customFileFormat']
-
         name = entry.attrib.get('id', entry.__dict__['_name'])
         name = make_key(name)
 
-        if (not stack or entry._name in reserved):
+        if (not stack or entry._name in _reserved_names):
             # remove old entry with this name if necessary
             try:
                 self.remove_entry(name)
@@ -322,6 +565,8 @@ class Entry(ABC):
             self.__dict__[name] = entry
 
         self._entries.append(entry)
+        if self.__dict__.get('_lookup') is not None:
+            self._add_lookup(self._lookup, len(self._entries) - 1, entry)
         entry._parent = self
         self._autosave()
         return self
@@ -339,6 +584,7 @@ class Entry(ABC):
         i, key = self._get_index(name)
         del self._entries[i]
         del self.__dict__[key]
+        self.__dict__['_lookup'] = None
         return self
 
     def set_attrib(self, name: str, value: str):
@@ -355,6 +601,9 @@ class Entry(ABC):
         name = validkey(name)
         self.attrib[name] = value
         self.__dict__.update({name: value})
+        if name == 'id' and self.__dict__.get('_parent') is not None:
+            # the id is used for looking up this entry in the parent
+            self._parent.__dict__['_lookup'] = None
         self._autosave()
         return self
 
@@ -449,13 +698,14 @@ class FileEntry(Entry):
         id = self.attrib.get('id', 'None')
         return "<{}({})>".format(self._name, id)
 
-    def __init__(self, id, attrib=None, parent='.', **kwargs):
+    def __init__(self, id, attrib=None, parent='.', lazy=False, **kwargs):
         super().__init__(attrib=attrib, parent=parent, **kwargs)
         if 'id' in self.attrib:
             # reading entry (id == None)
             valid_filename(self.id)
             self._filename = os.path.join(self._folder, self.id)
-            if not os.access(self._filename, os.F_OK):
+            # with lazy loading, the file is only checked by validate()
+            if not lazy and not os.access(self._filename, os.F_OK):
                 logger.error('File {} does not exist'.format(self.id))
         elif id:
             # writing entry
@@ -473,23 +723,382 @@ class FileEntry(Entry):
         if isinstance(parent, Entry):
             parent.add_entry(self)
 
+    @classmethod
+    def _from_xml(cls, attrib: dict, folder: str, lazy: bool = False,
+                  name: str = None) -> FileEntry:
+        """see Entry._from_xml"""
+        if 'id' not in attrib:
+            raise ValueError('The id must be supplied if it is not yet set.')
+        entry = super()._from_xml(attrib, folder, lazy=lazy, name=name)
+        valid_filename(entry.id)
+        entry.__dict__['_filename'] = os.path.join(folder, entry.id)
+        if not lazy and not os.access(entry._filename, os.F_OK):
+            logger.error('File {} does not exist'.format(entry.id))
+        return entry
+
+    def validate(self) -> FileEntry:
+        """
+        Checks that the file of this entry and of all its sub-entries exist.
+        Useful if the Unisens object was loaded with lazy=True,
+        as then the files are not checked on loading.
+
+        :raises FileNotFoundError: if a file does not exist
+        :returns: self
+        """
+        if not os.access(self._filename, os.F_OK):
+            raise FileNotFoundError(f'File {self.id} does not exist')
+        for entry in self._entries:
+            if isinstance(entry, FileEntry):
+                entry.validate()
+        return self
+
+
+def _format_block(data: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    Converts a block of data to `dtype` and checks that no information
+    is lost. Floats are rounded to 10 decimals before converting to
+    integers. Safe casts, e.g. int16 to int32, are not checked.
+    NaN can't be converted without loss unless the cast is safe.
+
+    :raises AssertionError: with the maximum error if the conversion is lossy
+    """
+    if np.can_cast(data.dtype, dtype, 'safe'):
+        return data.astype(dtype, copy=False)
+    if dtype.kind in 'iu' and data.dtype.kind in 'fc':
+        data = np.round(data, 10)
+    data_formatted = data.astype(dtype)
+    if data.size:
+        max_error = np.max(np.abs(data - data_formatted))
+        assert max_error < 1e-10, \
+            f"Can't format to dataType {dtype} without loss, max. error {max_error}"
+    return data_formatted
+
+
+def _aggregate_samples(data: np.ndarray, decimation: int) -> np.ndarray:
+    """
+    Computes min, max and mean of every `decimation` samples.
+
+    :param data: array of shape (n_channels, n_samples)
+    :returns: array of shape (n_bins, 3, n_channels), the last bin
+              contains the remaining samples if n_samples is not
+              a multiple of `decimation`
+    """
+    starts = np.arange(0, data.shape[1], decimation)
+    counts = np.diff(np.append(starts, data.shape[1]))
+    mins = np.minimum.reduceat(data, starts, axis=1)
+    maxs = np.maximum.reduceat(data, starts, axis=1)
+    means = np.add.reduceat(data, starts, axis=1) / counts
+    return np.stack([mins.T, maxs.T, means.T], axis=1)
+
+
+def _aggregate_bins(bins: np.ndarray, counts: np.ndarray, factor: int) -> np.ndarray:
+    """
+    Combines every `factor` bins of min, max and mean to one bin.
+
+    :param bins: array of shape (n_bins, 3, n_channels)
+    :param counts: the number of samples in each bin
+    :returns: array of shape (n_bins / factor, 3, n_channels)
+    """
+    starts = np.arange(0, len(bins), factor)
+    mins = np.minimum.reduceat(bins[:, 0], starts, axis=0)
+    maxs = np.maximum.reduceat(bins[:, 1], starts, axis=0)
+    sums = np.add.reduceat(bins[:, 2] * counts[:, None], starts, axis=0)
+    means = sums / np.add.reduceat(counts, starts)[:, None]
+    return np.stack([mins, maxs, means], axis=1)
+
 
 class SignalEntry(FileEntry):
 
     def __init__(self, id=None, attrib=None, parent='.', **kwargs):
         super().__init__(id=id, attrib=attrib, parent=parent, **kwargs)
 
-    def get_data(self, scaled: bool = True, return_type: str = None) -> np.array:
+    def _n_channels(self) -> int:
+        """number of channels as indicated by the channel entries"""
+        return len(self.channel) if isinstance(self.channel, list) else 1
+
+    def _channel_index(self, channels) -> (slice, list):
+        """
+        Converts a channel selection into something that can be used
+        to index the channel axis of the data.
+
+        :param channels: None for all channels, an int or channel name
+                         or a list of ints and/or channel names
+        :returns: a slice or a list of channel indices
+        """
+        if channels is None:
+            return slice(None)
+        if isinstance(channels, (int, np.integer, str)):
+            channels = [channels]
+        ch_entries = self.channel if isinstance(self.channel, list) else [self.channel]
+        names = [ch.attrib.get('name') for ch in ch_entries]
+        index = []
+        for ch in channels:
+            if isinstance(ch, str):
+                if ch not in names:
+                    raise KeyError(f'channel {ch} not found in {names}')
+                ch = names.index(ch)
+            if not -len(names) <= int(ch) < len(names):
+                raise IndexError(f'channel {ch} out of range for {len(names)} channels')
+            index.append(int(ch))
+        if index and index == list(range(index[0], index[0] + len(index))) \
+                and index[0] >= 0:
+            # consecutive channels can be read as a view, without copying
+            return slice(index[0], index[0] + len(index))
+        return index
+
+    def _sample_range(self, start, stop, unit: str, n_samples: int) -> Tuple[int, int]:
+        """
+        Converts start/stop given in samples or seconds to a sample range
+        that is clipped to the available data. Fractional samples are
+        rounded to the nearest sample.
+        """
+        if unit in ('seconds', 's', 'sec'):
+            sfreq = float(self.sampleRate)
+        elif unit in ('samples', 'n'):
+            sfreq = 1
+        else:
+            raise ValueError(f'unit must be "samples" or "seconds", is {unit}')
+        start = None if start is None else int(round(start * sfreq))
+        stop = None if stop is None else int(round(stop * sfreq))
+        start, stop, _ = slice(start, stop).indices(n_samples)
+        return start, max(start, stop)
+
+    def _bin_dtype(self) -> np.dtype:
+        """
+        The dtype of the binary file, with the byte order that is
+        given by the endianess of the binFileFormat (default LITTLE).
+        """
+        dtype = numpy_dtype(self.dataType)
+        fileFormat = self.__dict__.get('binFileFormat')
+        endianess = 'LITTLE' if fileFormat is None else \
+            str(fileFormat.attrib.get('endianess', 'LITTLE'))
+        if endianess.upper() not in ('LITTLE', 'BIG'):
+            raise ValueError(f'Unknown endianess {endianess}, must be LITTLE or BIG')
+        return dtype.newbyteorder('<' if endianess.upper() == 'LITTLE' else '>')
+
+    def _bin_layout(self) -> str:
+        """
+        The layout of the binary file as given in the binFileFormat:
+        'interleaved' (default) stores all channels sample by sample,
+        'planar' stores all samples of one channel after the other.
+        """
+        fileFormat = self.__dict__.get('binFileFormat')
+        layout = 'interleaved' if fileFormat is None else \
+            str(fileFormat.attrib.get('layout', 'interleaved')).lower()
+        if layout not in ('interleaved', 'planar'):
+            raise ValueError(f'Unknown layout {layout}, must be interleaved or planar')
+        return layout
+
+    def _compression(self) -> str:
+        """The compression given in the binFileFormat or None"""
+        fileFormat = self.__dict__.get('binFileFormat')
+        if fileFormat is None:
+            return None
+        return fileFormat.attrib.get('compression')
+
+    def _read_index(self) -> np.ndarray:
+        """
+        Reads the index file of a compressed binary file. It contains
+        the number of samples and then the offsets of all blocks
+        (plus the end of the last block) as little endian int64.
+        """
+        return np.fromfile(self._filename + '.idx', dtype='<i8')
+
+    def _n_samples(self) -> int:
+        """The number of samples in the binary file"""
+        if self._compression():
+            return int(self._read_index()[0])
+        itemsize = numpy_dtype(self.dataType).itemsize
+        return os.path.getsize(self._filename) // (itemsize * self._n_channels())
+
+    def _write_binary(self, data: np.ndarray, dtype: np.dtype, layout: str,
+                      compression: str = None, blockSize: int = 65536):
+        """
+        Converts the data of shape (n_channels, n_samples) to `dtype` and
+        writes it block by block, such that only one converted block is in
+        memory at a time. The data is written to a temporary file that
+        replaces the file of this entry when all blocks were written.
+        If a block can't be converted without loss, the old file is kept.
+
+        Compressed files are written in blocks of `blockSize` samples that
+        are compressed independently, such that windows can be read
+        without decompressing the whole file. The block offsets are
+        written to an index file next to the data.
+        """
+        n_channels, n_samples = data.shape
+        if compression:
+            compress, _ = get_codec(compression)
+        else:
+            # convert about 1M values at once
+            blockSize = max(1, 2**20 // max(1, n_channels))
+        tmp_file = os.path.join(os.path.dirname(self._filename),
+                                f'.{os.path.basename(self._filename)}.{os.getpid()}.tmp')
+        offsets = [0]
+        try:
+            with open(tmp_file, 'wb') as f:
+                if layout == 'planar':
+                    for channel in data:
+                        for i in range(0, n_samples, blockSize):
+                            block = _format_block(channel[i:i + blockSize], dtype)
+                            f.write(np.ascontiguousarray(block))
+                else:
+                    for i in range(0, n_samples, blockSize):
+                        block = _format_block(data[:, i:i + blockSize], dtype)
+                        # unisens reads rows*columns not columns*rows like numpy
+                        block = np.ascontiguousarray(block.T)
+                        if compression:
+                            block = compress(block.tobytes())
+                            offsets.append(offsets[-1] + len(block))
+                        f.write(block)
+            os.replace(tmp_file, self._filename)
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+        if os.path.isfile(self._filename + '.idx'):
+            os.remove(self._filename + '.idx')
+        if compression:
+            index = np.array([n_samples] + offsets, dtype='<i8')
+            index.tofile(self._filename + '.idx')
+
+    def _iter_compressed(self, start: int, stop: int, ch_index):
+        """
+        Decompresses only the blocks that overlap with start:stop and
+        yields tuples (first sample, block of shape (n_channels, n))
+        """
+        _, decompress = get_codec(self._compression())
+        blockSize = int(self.binFileFormat.blockSize)
+        dtype = self._bin_dtype()
+        n_channels = self._n_channels()
+        offsets = self._read_index()[1:]
+        with open(self._filename, 'rb') as f:
+            for b in range(start // blockSize, (stop - 1) // blockSize + 1):
+                f.seek(offsets[b])
+                raw = decompress(f.read(offsets[b + 1] - offsets[b]))
+                block = np.frombuffer(raw, dtype=dtype).reshape(-1, n_channels).T
+                first = max(start, b * blockSize)
+                last = min(stop, b * blockSize + block.shape[1])
+                yield first, block[ch_index, first - b * blockSize:last - b * blockSize]
+
+    def _memmap(self, n_samples: int) -> np.memmap:
+        """
+        Memory maps the binary file read-only as array of shape
+        (n_channels, n_samples), independent of the layout of the file.
+        """
+        n_channels = self._n_channels()
+        if self._bin_layout() == 'planar':
+            return np.memmap(self._filename, dtype=self._bin_dtype(), mode='r',
+                             shape=(n_channels, n_samples))
+        return np.memmap(self._filename, dtype=self._bin_dtype(), mode='r',
+                         shape=(n_samples, n_channels)).T
+
+    def _read_raw(self, start: int, stop: int, ch_index, copy: bool = True,
+                  out: np.ndarray = None, dtype=None, scale: tuple = None,
+                  blocksize: int = 2**16) -> np.ndarray:
+        """
+        Reads the samples start:stop of the selected channels of the
+        binary file into an array of shape (n_channels, n_samples).
+
+        The samples are copied from the memory mapped file in blocks,
+        converted to `dtype` (in native byte order) and scaled on the
+        way, such that no temporary copies of the whole data are made.
+        With copy=False, a read-only view of the memory mapped file is
+        returned instead, if all or a contiguous range of channels is
+        selected and neither scaling nor another dtype is requested.
+        Of compressed files, only the blocks within start:stop are read.
+
+        :param out: an array of shape (n_channels, n_samples) to write to
+        :param dtype: the dtype of the returned array. The default is
+                      float64 if scaled, else the dtype of the file.
+        :param scale: None or a tuple (baseline, lsbValue). If given,
+                      (data - baseline) * lsbValue is returned.
+        """
+        file_dtype = self._bin_dtype()
+        n_channels = self._n_channels()
+        n_samples = self._n_samples()
+        compressed = bool(self._compression())
+        start = min(start, n_samples)
+        stop = max(start, min(stop, n_samples))
+        n_selected = len(range(n_channels)[ch_index]) \
+            if isinstance(ch_index, slice) else len(ch_index)
+
+        if out is not None:
+            if out.shape != (n_selected, stop - start):
+                raise ValueError(f'out must have shape {(n_selected, stop - start)}, '
+                                 f'has {out.shape}')
+        elif not copy and scale is None and dtype is None and not compressed \
+                and isinstance(ch_index, slice) and stop > start:
+            return self._memmap(n_samples)[ch_index, start:stop]
+        else:
+            if dtype is None:
+                dtype = np.float64 if scale is not None else file_dtype
+            out = np.empty((n_selected, stop - start),
+                           dtype=np.dtype(dtype).newbyteorder('='))
+        if stop == start:
+            return out
+
+        if compressed:
+            blocks = self._iter_compressed(start, stop, ch_index)
+        else:
+            mmap = self._memmap(n_samples)
+            blocks = ((i, mmap[ch_index, i:min(i + blocksize, stop)])
+                      for i in range(start, stop, blocksize))
+        for i, data in blocks:
+            block = out[:, i - start:i - start + data.shape[1]]
+            block[:] = data
+            if scale is not None:
+                baseline, lsbValue = scale
+                if baseline is not None:
+                    np.subtract(block, baseline, out=block)
+                if lsbValue != 1:
+                    np.multiply(block, lsbValue, out=block)
+        return out
+
+    @cached
+    def get_data(self, scaled: bool = True, return_type: str = None,
+                 start: float = None, stop: float = None, channels=None,
+                 unit: str = 'samples', copy: bool = True, dtype=None,
+                 out: np.ndarray = None) -> np.array:
         """
         Will try to load the binary data using numpy.
-        This might not always work as endianess can't be determined
-        with numpy
+        The dtype and byte order of the data is taken from the dataType
+        and the endianess given in the binFileFormat.
+
+        For binary files, only the requested region of the file is read
+        (via a memory map), so short windows can be loaded from long
+        recordings without reading the whole file.
 
         Parameters
         ----------
         scaled : bool, optional
             Scale values using lsb factor or return raw numbers.
             The default is True.
+        start : int or float, optional
+            First sample (or second, see `unit`) to load. The default is
+            None, meaning from the beginning of the recording.
+        stop : int or float, optional
+            Sample (or second, see `unit`) up to which data is loaded,
+            excluding `stop` itself. The default is None, meaning until
+            the end of the recording.
+        channels : int, str or list, optional
+            Channel indices and/or channel names to load.
+            The default is None, meaning all channels.
+        unit : str, optional
+            Unit of `start` and `stop`, either 'samples' or 'seconds'.
+            Seconds are converted using the sampleRate of this entry.
+            The default is 'samples'.
+        copy : bool, optional
+            If False and scaled=False, a read-only view of the
+            memory mapped file is returned instead of a copy, if possible.
+            The data is then only read from disk when it is accessed.
+            The default is True.
+        dtype : np.dtype, optional
+            The dtype of the returned data, e.g. np.float32 to save memory.
+            The default is np.float64 for scaled data, else the dataType.
+        out : np.ndarray, optional
+            An array of shape (n_channels, n_samples) to which the data is
+            written, instead of allocating a new array. The default is None.
 
         Returns
         -------
@@ -502,37 +1111,442 @@ class SignalEntry(FileEntry):
             warnings.warn('The argument `return_type` has no effect and will be removed with the next release.',
                           category=DeprecationWarning, stacklevel=2)
 
+        ch_index = self._channel_index(channels)
+
         if self.id.endswith('csv'):
-            data = np.genfromtxt(self._filename, dtype=str, delimiter=self.csvFileFormat.separator)
-            data = data.astype(float)
-            return data.T
+            data = np.genfromtxt(self._filename, dtype=str, ndmin=2,
+                                 delimiter=self.csvFileFormat.separator)
+            data = data.astype(dtype or float).T
+            start, stop = self._sample_range(start, stop, unit, data.shape[1])
+            if len(data) == 1 and channels is None:
+                # single channel csv files are returned as 1D array
+                data = data[0, start:stop]
+            else:
+                data = data[ch_index, start:stop]
+            if out is not None:
+                out[:] = data
+                return out
+            return data
 
         assert self.id.endswith('bin') and 'lsbValue' in dir(self), \
             'incompatible id: SignalEntry only allows for .bin or .csv format'
-        n_channels = len(self.channel) if isinstance(self.channel, list) else 1
-        dtypestr = self.dataType.lower()
-        dtype = np.__dict__.get(dtypestr, f'UNKOWN_DATATYPE: {dtypestr}')
-        data = np.fromfile(self._filename, dtype=dtype)
-        if scaled:
-            if 'baseline' in self.attrib:
-                data = ((data - float(self.baseline)) * float(self.lsbValue))
-            elif self.lsbValue != 1:
-                data = (data * float(self.lsbValue))
-        return data.reshape([-1, n_channels]).T
+        start, stop = self._sample_range(start, stop, unit, self._n_samples())
+        # only map the file, the requested region is copied into memory
+        return self._read_raw(start, stop, ch_index, copy=copy, out=out,
+                              dtype=dtype, scale=self._scale(scaled))
+
+    def _get_csv_data(self) -> np.ndarray:
+        """
+        Loads a csv signal once as float64 array of shape
+        (n_channels, n_samples), e.g. for resampling it chunk by chunk.
+        The array is kept until the file changes on disk.
+        """
+        stat = os.stat(self._filename)
+        key = (stat.st_mtime_ns, stat.st_size)
+        csv_data = self.__dict__.get('_csv_data')
+        if csv_data is None or csv_data[0] != key:
+            csv_data = (key, np.atleast_2d(self.get_data(dtype=np.float64)))
+            self._csv_data = csv_data
+        return csv_data[1]
+
+    def _scale(self, scaled: bool = True):
+        """the tuple (baseline, lsbValue) for _read_raw, None if not scaled"""
+        if not scaled:
+            return None
+        baseline = float(self.baseline) if 'baseline' in self.attrib else None
+        return baseline, float(self.lsbValue)
+
+    def get_epochs(self, starts, n_samples: int, channels=None, scaled: bool = True,
+                   dtype=np.float64, fill_value=np.nan,
+                   max_read: int = 2**20) -> np.ndarray:
+        """
+        Cuts windows of the same length out of the signal, e.g. around events.
+        Only the windows are read from disk, in the order of their position
+        in the file. Overlapping windows are read at once. Samples of
+        windows that reach beyond the start or end of the signal are
+        filled with `fill_value`.
+
+        :param starts: the first sample of each window
+        :param n_samples: the length of the windows in samples
+        :param channels: channel indices and/or names, default all channels
+        :param scaled: scale values using lsbValue and baseline
+        :param dtype: the dtype of the returned array
+        :param fill_value: value of samples outside of the signal
+        :param max_read: overlapping windows are read together up to
+                         this many samples
+        :returns: array of shape (n_windows, n_channels, n_samples)
+        """
+        starts = np.asarray(starts, dtype=np.int64).ravel()
+        n_samples = int(n_samples)
+        ch_index = self._channel_index(channels)
+        if self.id.endswith('csv'):
+            data = np.atleast_2d(self.get_data(scaled=scaled, channels=channels))
+            n_total = data.shape[1]
+
+            def read(start, stop):
+                return data[:, start:stop]
+        else:
+            n_total = self._n_samples()
+            scale = self._scale(scaled)
+
+            def read(start, stop):
+                return self._read_raw(start, stop, ch_index, dtype=dtype, scale=scale)
+        n_channels = len(range(self._n_channels())[ch_index]) \
+            if isinstance(ch_index, slice) else len(ch_index)
+        epochs = np.full((len(starts), n_channels, n_samples), fill_value, dtype=dtype)
+
+        order = np.argsort(starts, kind='stable')
+        i = 0
+        while i < len(order):
+            first = starts[order[i]]
+            last = first + n_samples
+            j = i + 1
+            # overlapping windows are read at once
+            while j < len(order) and starts[order[j]] < last and \
+                    starts[order[j]] + n_samples - first <= max_read:
+                last = starts[order[j]] + n_samples
+                j += 1
+            start, stop = max(first, 0), min(last, n_total)
+            if stop > start:
+                region = read(start, stop)
+                for k in order[i:j]:
+                    a = max(starts[k], start)
+                    b = min(starts[k] + n_samples, stop)
+                    if b > a:
+                        epochs[k, :, a - starts[k]:b - starts[k]] = \
+                            region[:, a - start:b - start]
+            i = j
+        return epochs
+
+    def iter_chunks(self, chunk_samples: int, overlap: int = 0, channels=None,
+                    scaled: bool = True, dtype=np.float64, start: float = None,
+                    stop: float = None, unit: str = 'samples'):
+        """
+        Iterates over the signal in chunks of `chunk_samples` samples, e.g.
+        to filter recordings that don't fit into memory. Chunk i starts at
+        sample start + i * (chunk_samples - overlap), the last chunk can
+        be shorter. All chunks are written into the same array to avoid
+        allocations, so copy a chunk if it is needed after the next one
+        was read. Overlapping samples are not read again.
+
+        Example:
+            for chunk in entry.iter_chunks(256 * 60, overlap=256):
+                filtered = scipy.signal.lfilter(b, a, chunk)
+
+        :param chunk_samples: the number of samples per chunk
+        :param overlap: the number of samples that are shared by
+                        consecutive chunks, e.g. for filters
+        :param channels: channel indices and/or names, default all channels
+        :param scaled: scale values using lsbValue and baseline
+        :param dtype: the dtype of the chunks
+        :param start: first sample (or second, see `unit`), default 0
+        :param stop: last sample (exclusive), default the end of the signal
+        :param unit: unit of `start` and `stop`, 'samples' or 'seconds'
+        :returns: a generator of arrays of shape (n_channels, n_samples)
+        """
+        chunk_samples, overlap = int(chunk_samples), int(overlap)
+        if not 0 <= overlap < chunk_samples:
+            raise ValueError(f'overlap must be >= 0 and < chunk_samples, is {overlap}')
+        ch_index = self._channel_index(channels)
+        if self.id.endswith('csv'):
+            data = np.atleast_2d(self.get_data(scaled=scaled, channels=channels))
+            n_samples = data.shape[1]
+
+            def read(first, last, out):
+                np.copyto(out, data[:, first:last])
+        else:
+            n_samples = self._n_samples()
+            scale = self._scale(scaled)
+
+            def read(first, last, out):
+                self._read_raw(first, last, ch_index, out=out, scale=scale)
+        start, stop = self._sample_range(start, stop, unit, n_samples)
+        n_channels = len(range(self._n_channels())[ch_index]) \
+            if isinstance(ch_index, slice) else len(ch_index)
+        buffer = np.empty((n_channels, min(chunk_samples, stop - start)), dtype=dtype)
+
+        step = chunk_samples - overlap
+        first, n_read = start, 0  # n_read: samples of the last chunk in the buffer
+        while first < stop:
+            last = min(first + chunk_samples, stop)
+            # the overlap with the previous chunk is already in the buffer
+            n_reuse = max(0, n_read - step)
+            if n_reuse:
+                buffer[:, :n_reuse] = buffer[:, step:step + n_reuse]
+            chunk = buffer[:, :last - first]
+            read(first + n_reuse, last, chunk[:, n_reuse:])
+            yield chunk
+            if last == stop:
+                break
+            first, n_read = first + step, last - first
+
+    def _resample(self, k0: int, k1: int, sampleRate: float,
+                  method: str = 'linear') -> np.ndarray:
+        """
+        Resamples the scaled signal to the samples k0:k1 of `sampleRate`,
+        i.e. to the times k / sampleRate. Only the needed region of the
+        file is read. Times after the last sample are NaN.
+
+        :param method: 'linear' interpolation or 'polyphase' filtering
+                       (needs scipy), which avoids aliasing when the
+                       rate is reduced
+        :returns: array of shape (n_channels, k1 - k0)
+        """
+        sfreq = float(self.sampleRate)
+        if self.id.endswith('bin'):
+            n_samples = self._n_samples()
+
+            def read(start, stop):
+                return self.get_data(start=start, stop=stop, dtype=np.float64)
+        else:
+            data = self._get_csv_data()
+            n_samples = data.shape[1]
+
+            def read(start, stop):
+                return data[:, start:stop]
+        positions = np.arange(k0, k1) * (sfreq / sampleRate)
+        valid = (positions >= 0) & (positions <= n_samples - 1)
+        resampled = np.full((self._n_channels(), k1 - k0), np.nan)
+        if not valid.any():
+            return resampled
+
+        if method == 'linear':
+            first = int(positions[valid][0])
+            region = read(first, min(n_samples, int(positions[valid][-1]) + 2))
+            index = positions[valid].astype(np.int64) - first
+            weight = positions[valid] - np.floor(positions[valid])
+            after = np.minimum(index + 1, region.shape[1] - 1)
+            resampled[:, valid] = region[:, index] * (1 - weight) + region[:, after] * weight
+        elif method == 'polyphase':
+            signal = get_module('scipy.signal')
+            ratio = Fraction(sampleRate).limit_denominator(1000) / \
+                Fraction(sfreq).limit_denominator(1000)
+            up, down = ratio.numerator, ratio.denominator
+            # start at a sample that is aligned in both rates and read
+            # enough samples around the region for the filter to settle
+            pad = down * -(-10 * max(up, down) // (up * down))
+            start = max(0, (k0 // up) * down - pad)
+            stop = min(n_samples, -(-k1 // up) * down + pad)
+            filtered = signal.resample_poly(read(start, stop), up, down, axis=1)
+            offset = k0 - start // down * up
+            filtered = filtered[:, offset:offset + k1 - k0]
+            n = filtered.shape[1]
+            resampled[:, :n][:, valid[:n]] = filtered[:, valid[:n]]
+        else:
+            raise ValueError(f'method must be "linear" or "polyphase", is {method}')
+        return resampled
+
+    def _remove_pyramid(self):
+        """Removes the pyramid, e.g. if the data has changed"""
+        pyramid = self.__dict__.get('pyramid')
+        if pyramid is None:
+            return
+        file = os.path.join(self._folder, pyramid.file)
+        if os.path.isfile(file):
+            os.remove(file)
+        self.remove_entry('pyramid')
 
+    def _pyramid_levels(self) -> list:
+        """
+        The levels of the pyramid as tuples (decimation, n_bins, offset),
+        or an empty list if there is no pyramid or it is out of date.
+        """
+        pyramid = self.__dict__.get('pyramid')
+        if pyramid is None:
+            return []
+        file = os.path.join(self._folder, pyramid.file)
+        if not os.path.isfile(file) or int(pyramid.nSamples) != self._n_samples():
+            return []
+        n_samples, decimation = int(pyramid.nSamples), int(pyramid.decimation)
+        itemsize = 3 * self._n_channels() * np.dtype(np.float32).itemsize
+        levels, offset = [], 0
+        for _ in range(int(pyramid.levels)):
+            n_bins = -(-n_samples // decimation)
+            levels.append((decimation, n_bins, offset))
+            offset += n_bins * itemsize
+            decimation *= int(pyramid.factor)
+        return levels
+
+    @batched
+    def build_pyramid(self, decimation: int = 64, factor: int = 4,
+                      chunksize: int = 2**20) -> SignalEntry:
+        """
+        Computes min, max and mean of the scaled signal for successively
+        larger bins of samples, such that an overview of long recordings
+        can be plotted quickly, see get_overview(). The first level has
+        bins of `decimation` samples, each following level combines
+        `factor` bins of the previous level.
+
+        The levels are saved as float32 to id + '.pyramid', which is
+        referenced by a 'pyramid' entry of this SignalEntry.
+
+        :param decimation: the number of samples per bin of the first level
+        :param factor: the number of bins that are combined for the next level
+        :param chunksize: number of samples that are read at once
+        :returns: self
+        """
+        self._check_readonly()
+        assert self.id.endswith('bin'), 'pyramids are only supported for .bin files'
+        assert decimation >= 1 and factor >= 2, 'decimation >= 1 and factor >= 2 needed'
+        n_samples = self._n_samples()
+        n_channels = self._n_channels()
+        filename = self.id + '.pyramid'
+        file = os.path.join(self._folder, filename)
+        chunksize = max(1, chunksize // decimation) * decimation
+
+        with open(file, 'wb') as f:
+            for i in range(0, n_samples, chunksize):
+                data = self.get_data(start=i, stop=min(i + chunksize, n_samples),
+                                     dtype=np.float64)
+                f.write(_aggregate_samples(data, decimation).astype(np.float32).tobytes())
+
+        n_levels, n_bins, offset = 1, -(-n_samples // decimation), 0
+        level_decimation = decimation
+        shape = (3, n_channels)
+        itemsize = 3 * n_channels * np.dtype(np.float32).itemsize
+        while n_bins > 1:
+            # the next level is computed from the previous level on disk
+            previous = np.memmap(file, dtype=np.float32, mode='r', offset=offset,
+                                 shape=(n_bins,) + shape)
+            counts = np.minimum(level_decimation,
+                                n_samples - np.arange(n_bins) * level_decimation)
+            step = max(1, chunksize // factor) * factor
+            with open(file, 'ab') as f:
+                for i in range(0, n_bins, step):
+                    bins = _aggregate_bins(previous[i:i + step].astype(np.float64),
+                                           counts[i:i + step], factor)
+                    f.write(bins.astype(np.float32).tobytes())
+            del previous
+            offset += n_bins * itemsize
+            n_bins = -(-n_bins // factor)
+            level_decimation *= factor
+            n_levels += 1
+
+        pyramid = MiscEntry('pyramid', parent=self._folder)
+        for key, value in [('file', filename), ('decimation', decimation),
+                           ('factor', factor), ('levels', n_levels),
+                           ('nSamples', n_samples)]:
+            pyramid.set_attrib(key, value)
+        self.add_entry(pyramid)
+        return self
+
+    def get_overview(self, start: float = None, stop: float = None,
+                     width: int = 1000, channels=None,
+                     unit: str = 'samples') -> AttrDict:
+        """
+        Returns min, max and mean of the scaled signal in about `width`
+        bins (at least `width` if the range has enough samples), e.g. to
+        plot an overview with one bin per pixel. The bins are taken from
+        the coarsest fitting level of the pyramid, so the time needed
+        does not depend on the length of the recording. The pyramid is
+        built if it does not exist or is out of date. If the entry is
+        read-only or a csv file, the bins are computed from the data instead.
+
+        The bins are aligned to multiples of the decimation, so the first
+        and last bin can include samples just outside of start and stop.
+
+        :param start: first sample (or second, see `unit`) of the range
+        :param stop: sample (or second) up to which the range goes
+        :param width: the number of bins, e.g. the plot width in pixels
+        :param channels: channel indices and/or names, default all
+        :param unit: unit of `start` and `stop`, 'samples' or 'seconds'
+        :returns: an AttrDict with the arrays `min`, `max` and `mean`
+                  of shape (n_channels, n_bins), `times` with the start
+                  of each bin in seconds, and the `decimation` used
+        """
+        csv_data = None
+        if self.id.endswith('bin'):
+            n_samples = self._n_samples()
+            levels = self._pyramid_levels()
+            if not levels:
+                try:
+                    self._check_readonly()
+                    levels = self.build_pyramid()._pyramid_levels()
+                except IOError:
+                    pass
+        else:
+            # csv files have no pyramid, the bins are computed from the data
+            csv_data = np.atleast_2d(self.get_data(channels=channels, dtype=np.float64))
+            n_samples = csv_data.shape[1]
+            levels = []
+        start, stop = self._sample_range(start, stop, unit, n_samples)
+        ch_index = self._channel_index(channels)
+        sampleRate = float(self.sampleRate)
+
+        fitting = [level for level in levels if -(-(stop - start) // level[0]) >= width]
+
+        if fitting:
+            decimation, n_bins, offset = fitting[-1]
+            first, last = start // decimation, -(-stop // decimation)
+            n_channels = self._n_channels()
+            file = os.path.join(self._folder, self.pyramid.file)
+            mmap = np.memmap(file, dtype=np.float32, mode='r', offset=offset,
+                             shape=(n_bins, 3, n_channels))
+            bins = np.array(mmap[first:last][:, :, ch_index])
+            del mmap
+        else:
+            # the range is too short for the pyramid or there is none
+            decimation = max(1, (stop - start) // width)
+            first = start // decimation
+            if csv_data is not None:
+                data = csv_data[:, first * decimation:stop]
+            else:
+                data = self.get_data(start=first * decimation, stop=stop,
+                                     channels=channels, dtype=np.float64)
+            bins = _aggregate_samples(np.atleast_2d(data), decimation)
+        times = (first + np.arange(len(bins))) * decimation / sampleRate
+        return AttrDict(min=bins[:, 0].T, max=bins[:, 1].T, mean=bins[:, 2].T,
+                        times=times, decimation=decimation)
+
+    @batched
+    def writer(self, sampleRate: float = None, dataType: str = None,
+               ch_names: list = None, mode: str = 'w', **kwargs) -> SignalWriter:
+        """
+        Returns a SignalWriter that writes data to this SignalEntry block
+        by block, e.g. for data that is streamed from a device or for
+        recordings that do not fit into memory. Use it as a context manager.
+
+        Parameters
+        ----------
+        sampleRate : float, optional
+            the sample rate of this data. Must be set if not present yet.
+        dataType : str, optional
+            The data type of the data. If None, it is taken from the
+            entry or infered from the first block.
+        ch_names : list, optional
+            The channel names. If None, taken from the entry.
+        mode : str, optional
+            'w' to overwrite the file, 'a' to append to existing data.
+            The default is 'w'.
+        **kwargs : str
+            further attributes that are set, e.g. unit, lsbValue.
+
+        Returns
+        -------
+        SignalWriter
+            a writer with a `write(data)` method accepting
+            arrays of shape (n_channels, n_samples).
+        """
+        return SignalWriter(self, sampleRate=sampleRate, dataType=dataType,
+                            ch_names=ch_names, mode=mode, **kwargs)
+
+    @batched
     def set_data(self, data: np.ndarray, sampleRate: float = None, dataType: str = None,
                  ch_names: list = None, unit: str = None,
                  lsbValue: float = None, adcZero: int = None,
                  adcResolution: int = None, baseline: int = None,
                  comment: str = None, contentClass: str = None,
                  source: str = None, sourceId: str = None,
-                 decimalSeparator: str = '.', separator: str = ';', **kwargs):
+                 decimalSeparator: str = '.', separator: str = ';',
+                 layout: str = 'interleaved', compression: str = None,
+                 blockSize: int = 65536, **kwargs):
         """
         Set the data that is connected to this SignalEntry.
         The decision between binary and csv output is made with the 'id' from initialization.
 
         binary: Data will be stored after formatting to dataType. Please ensure that formatting is possible without
-        loss of information. Scaling (with lsbValue and baseline) is only supported for reading.
+        loss of information, else an AssertionError with the maximum error is raised and the old file is kept.
+        Scaling (with lsbValue and baseline) is only supported for reading.
         The data will in any case be saved with Endianness LITTLE,
         as this is the default for numpy. Data will be saved using
         numpy binary data output.
@@ -566,51 +1580,80 @@ class SignalEntry(FileEntry):
             DESCRIPTION. The default is None.
         baseline : float, optional
             DESCRIPTION. The default is None.
+        layout : str, optional
+            Layout of binary files. 'interleaved' saves all channels sample
+            by sample, as defined by Unisens. 'planar' saves one channel
+            after the other, which makes reading single channels faster.
+            The layout is stored in the binFileFormat. Be aware that other
+            Unisens readers might not support planar files.
+            The default is 'interleaved'.
+        compression : str, optional
+            Compress binary files with 'zlib', 'lzma' or 'zstd' (needs
+            zstandard). The data is compressed in blocks of `blockSize`
+            samples and the block offsets are saved in id + '.idx', such
+            that windows can be read without decompressing the whole file.
+            The compression is stored in the binFileFormat. Be aware that
+            other Unisens readers can't read compressed files.
+            The default is None.
+        blockSize : int, optional
+            Number of samples per compressed block. The default is 65536.
         **kwargs : TYPE
             DESCRIPTION.
         """
 
         self._check_readonly()
+        self._invalidate_cache()
 
-        data = np.atleast_2d(np.array(data))
+        data = np.atleast_2d(np.asarray(data))
         if dataType is None:
             if 'dataType' in self.attrib:
                 dataType = self.dataType
             else:
                 dataType = str(data.dtype)
-        self.set_attrib('dataType', infer_dtype(dataType).lower())
-
-        if lsbValue is not None:
-            self.set_attrib('lsbValue', lsbValue)
-        elif 'lsbValue' not in self.attrib:
-            self.set_attrib('lsbValue', 1)
-        if baseline is not None:
-            self.set_attrib('baseline', baseline)
+        dataType = infer_dtype(dataType).lower()
 
+        # the data is written before the header is changed, such that a
+        # failed write leaves both the old file and the old header
         if self.id.endswith('csv'):
+            write_csv(self._filename, data.T, sep=separator, decimal_sep=decimalSeparator)
+            self._csv_data = None
+
             fileFormat = MiscEntry('csvFileFormat', parent=self)
             fileFormat.set_attrib('decimalSeparator', decimalSeparator)
             fileFormat.set_attrib('separator', separator)
             self.add_entry(fileFormat)
-
-            write_csv(self._filename, data.T, sep=self.csvFileFormat.separator,
-                      decimal_sep=self.csvFileFormat.decimalSeparator)
         elif self.id.endswith('bin'):
             order = sys.byteorder.upper()  # endianess
+            assert layout in ('interleaved', 'planar'), \
+                f'layout must be "interleaved" or "planar", is {layout}'
+            assert not (compression and layout == 'planar'), \
+                'compression is only possible with interleaved layout'
+            if compression:
+                get_codec(compression)  # fail before anything is written
+            self._write_binary(data, numpy_dtype(dataType), layout=layout,
+                               compression=compression, blockSize=int(blockSize))
+            self._remove_pyramid()
+
             fileFormat = MiscEntry('binFileFormat', key='endianess', value=order)
+            if layout == 'planar':
+                fileFormat.set_attrib('layout', layout)
+            if compression:
+                fileFormat.set_attrib('compression', compression.lower())
+                fileFormat.set_attrib('blockSize', int(blockSize))
             self.add_entry(fileFormat)
-
-            if 'int' in dataType:
-                data = np.round(data, 10)
-            data_formatted = data.astype(dataType)
-            assert abs(np.sum(data - data_formatted)) < 1e-10, \
-                f"Can't format to dataType {dataType} without loss."
-
-            # save data transposed because unisens reads rows*columns not columns*rows like numpy
-            data_formatted.T.tofile(self._filename)
         else:
             raise ValueError('incompatible id: SignalEntry only allows for .bin or .csv format')
 
+        self.set_attrib('dataType', dataType)
+        if 'sampleCount' in self.attrib:
+            self.set_attrib('sampleCount', data.shape[1])
+        if lsbValue is not None:
+            self.set_attrib('lsbValue', lsbValue)
+        elif 'lsbValue' not in self.attrib:
+            self.set_attrib('lsbValue', 1)
+        if baseline is not None:
+            self.set_attrib('baseline', baseline)
+
         self._set_channels(ch_names, n_data=len(data))
 
         if sampleRate is not None:
@@ -639,6 +1682,151 @@ class SignalEntry(FileEntry):
         return self
 
 
+class SignalWriter:
+    """
+    Appends data to the binary file of a SignalEntry block by block.
+
+    Create it via SignalEntry.writer(). Each block is converted to the
+    dataType of the entry, checked for lossless conversion and appended
+    to the file, which is flushed after every block. This way only one
+    block needs to be kept in memory and data written so far remains on
+    disk if the process is interrupted. When closing the writer, the
+    sampleCount of the entry and the duration of the Unisens object
+    are updated.
+
+    Example:
+        with entry.writer(sampleRate=256, ch_names=['ECG']) as writer:
+            for block in blocks:
+                writer.write(block)
+    """
+
+    def __init__(self, entry: SignalEntry, sampleRate: float = None,
+                 dataType: str = None, ch_names: list = None,
+                 mode: str = 'w', **kwargs):
+        entry._check_readonly()
+        assert entry.id.endswith('bin'), \
+            'incompatible id: SignalWriter only allows for .bin format'
+        assert mode in ('w', 'a'), f'mode must be "w" or "a", is {mode}'
+        self.entry = entry
+        self.n_samples = 0
+        self._ch_names = ch_names
+        self._dtype = None
+
+        if sampleRate is not None:
+            entry.set_attrib('sampleRate', sampleRate)
+        assert 'sampleRate' in entry.attrib, \
+            "Please specify sampleRate for correct visualization."
+        if dataType is not None:
+            entry.set_attrib('dataType', infer_dtype(dataType).lower())
+        if 'lsbValue' not in entry.attrib:
+            entry.set_attrib('lsbValue', 1)
+        for key in kwargs:
+            entry.set_attrib(key, kwargs[key])
+
+        order = sys.byteorder.upper()  # endianess
+        if mode == 'a' and os.path.isfile(entry._filename):
+            assert 'dataType' in entry.attrib, 'dataType missing, can\'t append'
+            if entry._bin_layout() != 'interleaved' or entry._compression():
+                raise ValueError('Can only append to uncompressed files '
+                                 'with interleaved layout')
+            if ch_names is None:
+                n_channels = entry._n_channels()
+            else:
+                n_channels = len([ch_names] if isinstance(ch_names, str) else ch_names)
+            self._init_format(n_channels=n_channels)
+            # blocks are appended in the byte order of the existing file
+            self._dtype = entry._bin_dtype()
+            itemsize = self._dtype.itemsize * self.n_channels
+            self.n_samples = os.path.getsize(entry._filename) // itemsize
+        else:
+            mode = 'w'
+            if os.path.isfile(entry._filename + '.idx'):
+                os.remove(entry._filename + '.idx')
+            fileFormat = MiscEntry('binFileFormat', key='endianess', value=order)
+            entry.add_entry(fileFormat)
+        entry._remove_pyramid()
+        self._file = open(entry._filename, mode + 'b')
+        entry._autosave()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _init_format(self, n_channels: int, dtype: str = None):
+        """set dataType and channels, either from the entry or the first block"""
+        if 'dataType' not in self.entry.attrib:
+            self.entry.set_attrib('dataType', infer_dtype(str(dtype)).lower())
+        self.entry._set_channels(self._ch_names, n_data=n_channels)
+        self._dtype = numpy_dtype(self.entry.dataType)
+        self.n_channels = n_channels
+
+    def write(self, data: np.ndarray):
+        """
+        Append a block of data to the file.
+
+        :param data: array of shape (n_channels, n_samples)
+        """
+        assert not self._file.closed, 'SignalWriter is already closed'
+        data = np.atleast_2d(np.asarray(data))
+        if self._dtype is None:
+            self._init_format(n_channels=len(data), dtype=data.dtype)
+        assert len(data) == self.n_channels, \
+            f'data must have {self.n_channels} channels, has {len(data)}'
+
+        data_formatted = _format_block(data, self._dtype)
+
+        # save data transposed because unisens reads rows*columns
+        self._file.write(np.ascontiguousarray(data_formatted.T))
+        self._file.flush()
+        self.entry._invalidate_cache()
+        self.n_samples += data.shape[1]
+        return self
+
+    def batch(self):
+        """see Entry.batch()"""
+        return self.entry.batch()
+
+    @batched
+    def close(self) -> SignalEntry:
+        """
+        Close the file, set the sampleCount of the entry and update the
+        duration of the Unisens object if the signal is longer than the
+        current duration. If no block was written, the format is taken
+        from the entry or the arguments of the writer, else it is double
+        with the given channels, or with one channel if there are none.
+        """
+        if self._file.closed:
+            return self.entry
+        self._file.close()
+
+        if self._dtype is None:
+            if self._ch_names is not None:
+                ch_names = self._ch_names
+                n_channels = len([ch_names] if isinstance(ch_names, str) else ch_names)
+            elif 'channel' in self.entry:
+                n_channels = self.entry._n_channels()
+            else:
+                n_channels = 1
+            self._init_format(n_channels=n_channels, dtype=np.dtype(np.float64))
+        self.entry.set_attrib('sampleCount', self.n_samples)
+
+        root = self.entry._root()
+        duration = self.n_samples / float(self.entry.sampleRate)
+        if duration.is_integer():
+            duration = int(duration)
+        if root._name == 'unisens':
+            try:
+                current = float(str2num(root.attrib.get('duration', 0)))
+            except (TypeError, ValueError):
+                current = 0
+            if not current >= duration:
+                root.set_attrib('duration', duration)
+        self.entry._autosave()
+        return self.entry
+
+
 class CsvFileEntry(FileEntry):
     """
     A FileEntry that links a csv file.
@@ -657,6 +1845,21 @@ class CsvFileEntry(FileEntry):
         csvFileFormat.set_attrib('separator', separator)
         self.add_entry(csvFileFormat)
 
+    @classmethod
+    def _from_xml(cls, attrib: dict, folder: str, lazy: bool = False,
+                  name: str = None) -> CsvFileEntry:
+        """see Entry._from_xml"""
+        entry = super()._from_xml(attrib, folder, lazy=lazy, name=name)
+        if not str(entry.id).endswith('csv'):
+            logger.warning(f'id "{entry.id}" does not end in .csv')
+        # the default format, replaced by the csvFileFormat of the XML
+        csvFileFormat = MiscEntry._from_xml({'decimalSeparator': '.',
+                                             'separator': ';'},
+                                            folder, name='csvFileFormat')
+        entry._append_entry(csvFileFormat)
+        return entry
+
+    @batched
     def set_data(self, data: list, **kwargs):
         """
         Set data of this csv object.
@@ -671,6 +1874,7 @@ class CsvFileEntry(FileEntry):
         """
 
         self._check_readonly()
+        self._invalidate_cache()
 
         assert 'csvFileFormat' in self.__dict__, 'csvFileFormat information' \
                                                  'missing: No separator and decimal set'
@@ -683,26 +1887,43 @@ class CsvFileEntry(FileEntry):
             logger.warning('Should supply at least two columns: time and data')
 
         write_csv(self._filename, data, sep=sep, decimal_sep=dec)
+        self._time_index = None
 
         for key in kwargs:
             self.set_attrib(key, kwargs[key])
         self._autosave()
         return self
 
+    def _fields(self) -> Tuple[List[str], dict]:
+        """
+        Names and fixed dtypes of the columns of this csv file,
+        used for loading the data as structured array.
+        """
+        return ['time'], {}
+
+    @cached
     def get_data(self, mode: str = 'list'):
         """
         Will try to load the csv data using a list, pandas or numpy.
+
+        With mode='structured', a numpy structured array is returned with a
+        'time' field and typed fields for the other columns, e.g. 'label'
+        for EventEntry or the channel names for ValuesEntry.
         
         :param mode: select the return type
-                     valid options: ['list', 'pandas', 'numpy']
-        :returns: a list, dataframe or numpy array
+                     valid options: ['list', 'pandas', 'numpy', 'structured']
+        :returns: a list, dataframe, numpy array or structured array
         """
-        sep = self.csvFileFormat.separator
-        dec = self.csvFileFormat.decimalSeparator
+        sep = self.csvFileFormat.attrib.get('separator', ';')
+        dec = self.csvFileFormat.attrib.get('decimalSeparator', '.')
 
         if mode in ('numpy', 'np', 'array'):
             lines = np.genfromtxt(self._filename, delimiter=sep,
                                   dtype=str)
+        elif mode in ('structured', 'records'):
+            names, dtypes = self._fields()
+            lines = read_csv_structured(self._filename, names=names, dtypes=dtypes,
+                                        sep=sep, decimal_sep=dec)
         elif mode in ('pandas', 'pd', 'dataframe'):
             import pandas as pd
             lines = pd.read_csv(self._filename, sep=sep,
@@ -712,9 +1933,112 @@ class CsvFileEntry(FileEntry):
                              convert_nums=True)
         else:
             raise ValueError('Invalid mode: {}, select from'
-                             '["numpy", "pandas", "list"]'.format(mode))
+                             '["numpy", "pandas", "list", "structured"]'.format(mode))
         return lines
 
+    @batched
+    def writer(self, mode: str = 'a', ch_names: list = None,
+               buffer_size: int = 1000, **kwargs) -> CsvWriter:
+        """
+        Returns a CsvWriter that appends rows to the csv file without
+        rewriting it, e.g. to add events one by one while recording.
+        Use it as a context manager.
+
+        Example:
+            with events.writer() as writer:
+                writer.append(250, 'start')
+                writer.append(1000, 'stop')
+
+        :param mode: 'a' to append to existing data, 'w' to overwrite it.
+                     The default is 'a'.
+        :param ch_names: the channel names of a ValuesEntry. If None,
+                         they are taken from the entry.
+        :param buffer_size: number of rows that are buffered before they
+                            are written to the file
+        :param kwargs: further attributes that are set, e.g. sampleRate
+        :returns: a CsvWriter with `append(time, *values)` and `extend(rows)`
+        """
+        return CsvWriter(self, mode=mode, ch_names=ch_names,
+                         buffer_size=buffer_size, **kwargs)
+
+    def _get_time_index(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Loads the csv file once as structured array sorted by time.
+        The index is kept until the file changes on disk.
+
+        :returns: the sorted times and the sorted structured array
+        """
+        stat = os.stat(self._filename)
+        key = (stat.st_mtime_ns, stat.st_size)
+        index = self.__dict__.get('_time_index')
+        if index is None or index[0] != key:
+            data = self.get_data(mode='structured')
+            if data.dtype.names[0] != 'time' or data.dtype['time'].kind not in 'iuf':
+                raise ValueError(f'first column of {self.id} must contain numeric times')
+            data = data[np.argsort(data['time'], kind='stable')]
+            index = (key, data['time'], data)
+            self._time_index = index
+        return index[1], index[2]
+
+    def _to_samples(self, time, unit: str):
+        """converts a time in samples or seconds to samples"""
+        if time is None or unit in ('samples', 'n'):
+            return time
+        if unit in ('seconds', 's', 'sec'):
+            return np.asarray(time) * float(self.sampleRate)
+        raise ValueError(f'unit must be "samples" or "seconds", is {unit}')
+
+    def _result(self, data: np.ndarray) -> AttrDict:
+        """packs the selected rows with their times in samples and seconds"""
+        samples = data['time']
+        seconds = samples / float(self.sampleRate) if 'sampleRate' in self.attrib else None
+        result = AttrDict(samples=samples, seconds=seconds, data=data)
+        if 'label' in data.dtype.names:
+            result['labels'] = data['label']
+        return result
+
+    def get_range(self, start: float = None, stop: float = None,
+                  unit: str = 'samples') -> AttrDict:
+        """
+        Returns all rows with start <= time < stop, sorted by time.
+        The file is only parsed on the first call, later calls do a
+        binary search on the sorted times.
+
+        :param start: the start of the range, default from the beginning
+        :param stop: the end of the range (exclusive), default until the end
+        :param unit: unit of `start` and `stop`, 'samples' or 'seconds'
+        :returns: an AttrDict with the times as numpy arrays in `samples`
+                  and `seconds`, the rows as structured array in `data`
+                  and for EventEntries the `labels`
+        """
+        times, data = self._get_time_index()
+        start, stop = self._to_samples(start, unit), self._to_samples(stop, unit)
+        first = 0 if start is None else np.searchsorted(times, start, side='left')
+        last = len(times) if stop is None else np.searchsorted(times, stop, side='left')
+        return self._result(data[first:max(first, last)])
+
+    def get_nearest(self, time, unit: str = 'samples') -> AttrDict:
+        """
+        Returns the row with the time that is nearest to `time`.
+        If `time` is an array, the nearest row for each of them.
+
+        :param time: a time or an array of times
+        :param unit: unit of `time`, 'samples' or 'seconds'
+        :returns: an AttrDict as returned by get_range()
+        """
+        times, data = self._get_time_index()
+        if len(times) == 0:
+            raise ValueError(f'{self.id} contains no data')
+        time = self._to_samples(np.asarray(time), unit)
+        right = np.clip(np.searchsorted(times, time), 1, len(times) - 1)
+        left = right - 1
+        if len(times) == 1:
+            index = np.zeros_like(right)
+        else:
+            index = np.where(np.abs(time - times[left]) <= np.abs(times[right] - time),
+                             left, right)
+        return self._result(data[index])
+
     def get_times(self):
         """
         Retrieves the times or samples of this CSV entry
@@ -752,6 +2076,36 @@ class ValuesEntry(CsvFileEntry):
     def __init__(self, id=None, attrib=None, parent='.', **kwargs):
         super().__init__(id=id, attrib=attrib, parent=parent, **kwargs)
 
+    def _fields(self) -> Tuple[List[str], dict]:
+        channels = self.__dict__.get('channel', [])
+        channels = channels if isinstance(channels, list) else [channels]
+        return ['time'] + [ch.attrib.get('name') for ch in channels], {}
+
+    def _resample(self, k0: int, k1: int, sampleRate: float,
+                  method: str = 'linear') -> np.ndarray:
+        """
+        Interpolates the values linearly to the samples k0:k1 of
+        `sampleRate`, i.e. to the times k / sampleRate. The values can
+        be irregularly sampled, so 'polyphase' is done linearly as well.
+        Times before the first and after the last value are NaN.
+
+        :returns: array of shape (n_channels, k1 - k0)
+        """
+        if method not in ('linear', 'polyphase'):
+            raise ValueError(f'method must be "linear" or "polyphase", is {method}')
+        times, data = self._get_time_index()
+        seconds = times / float(self.sampleRate)
+        targets = np.arange(k0, k1) / sampleRate
+        names = data.dtype.names[1:]
+        resampled = np.full((len(names), k1 - k0), np.nan)
+        if len(times) == 0:
+            return resampled
+        for i, name in enumerate(names):
+            resampled[i] = np.interp(targets, seconds, data[name].astype(np.float64),
+                                     left=np.nan, right=np.nan)
+        return resampled
+
+    @batched
     def set_data(self, data: list, ch_names=None, **kwargs):
         # if we get a string supplied, we convert to list
         super().set_data(data, **kwargs)
@@ -766,6 +2120,126 @@ class EventEntry(CsvFileEntry):
     def __init__(self, id=None, attrib=None, parent='.', **kwargs):
         super().__init__(id=id, attrib=attrib, parent=parent, **kwargs)
 
+    def _fields(self) -> Tuple[List[str], dict]:
+        return ['time', 'label', 'comment'], {'label': str, 'comment': str}
+
+
+class CsvWriter():
+    """
+    Appends rows to the csv file of an EventEntry or ValuesEntry.
+    Rows are buffered and written as complete lines, such that the file
+    stays valid after every flush. The time of each row (first column)
+    must not be smaller than the time of the previous row.
+
+    Example:
+        with entry.writer() as writer:
+            for time, label in events:
+                writer.append(time, label)
+    """
+
+    def __init__(self, entry: CsvFileEntry, mode: str = 'a',
+                 ch_names: list = None, buffer_size: int = 1000, **kwargs):
+        entry._check_readonly()
+        assert mode in ('w', 'a'), f'mode must be "w" or "a", is {mode}'
+        assert 'csvFileFormat' in entry.__dict__, 'csvFileFormat information' \
+                                                  'missing: No separator and decimal set'
+        self.entry = entry
+        self.buffer_size = buffer_size
+        self.n_rows = 0
+        self._ch_names = ch_names
+        self._n_columns = None
+        self._buffer = []
+        self._sep = entry.csvFileFormat.attrib.get('separator', ';')
+        self._dec = entry.csvFileFormat.attrib.get('decimalSeparator', '.')
+        for key in kwargs:
+            entry.set_attrib(key, kwargs[key])
+
+        self.last_time = None
+        if mode == 'a' and os.path.isfile(entry._filename) \
+                and os.path.getsize(entry._filename) > 0:
+            times, data = entry._get_time_index()
+            if len(times):
+                self.last_time = times[-1]
+                self._n_columns = len(data.dtype.names)
+            with open(entry._filename, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                missing_newline = f.read(1) != b'\n'
+            self._file = open(entry._filename, 'a')
+            if missing_newline:
+                self._file.write('\n')
+        else:
+            self._file = open(entry._filename, 'w')
+        entry._invalidate_cache()
+        entry._autosave()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def append(self, time, *values) -> CsvWriter:
+        """
+        Append one row, e.g. append(250, 'R') for an event
+        or append(10, 1.5, 2.5) for two values at sample 10.
+
+        :param time: the time of the row in samples
+        :param values: the label or the values of the row
+        """
+        assert not self._file.closed, 'CsvWriter is already closed'
+        if self.last_time is not None and time < self.last_time:
+            raise ValueError(f'times must be increasing, {time} < {self.last_time}')
+        row = (time,) + values
+        if self._n_columns is None:
+            self._init_columns(len(row))
+        elif len(row) != self._n_columns and isinstance(self.entry, ValuesEntry):
+            raise ValueError(f'row must have {self._n_columns} columns, has {len(row)}')
+        self._buffer.append(self._sep.join([num2str(e, self._dec) for e in row]))
+        self.last_time = time
+        self.n_rows += 1
+        if len(self._buffer) >= self.buffer_size:
+            self.flush()
+        return self
+
+    def extend(self, rows) -> CsvWriter:
+        """
+        Append several rows.
+
+        :param rows: a list of rows or 2D array, each row starting with the time
+        """
+        for row in rows:
+            self.append(*row)
+        return self
+
+    def _init_columns(self, n_columns: int):
+        """set the channels of a ValuesEntry once, with the first row"""
+        self._n_columns = n_columns
+        if isinstance(self.entry, ValuesEntry):
+            self.entry._set_channels(self._ch_names, n_data=n_columns - 1)
+
+    def flush(self) -> CsvWriter:
+        """write the buffered rows to the file"""
+        if self._buffer:
+            self._file.write('\n'.join(self._buffer) + '\n')
+            self._buffer = []
+        self._file.flush()
+        self.entry._invalidate_cache()
+        return self
+
+    @batched
+    def close(self) -> CsvFileEntry:
+        """write the buffered rows and close the file"""
+        if self._file.closed:
+            return self.entry
+        self.flush()
+        self._file.close()
+        self.entry._autosave()
+        return self.entry
+
+    def batch(self):
+        """see Entry.batch()"""
+        return self.entry.batch()
+
 
 class CustomEntry(FileEntry):
 
@@ -810,6 +2284,18 @@ class CustomEntry(FileEntry):
             else:
                 dtype = 'binary'
 
+        data = self._load(dtype)
+        self.dataType = dtype
+        return data
+
+    def _cache_state(self) -> tuple:
+        # dataType is set by get_data, the dtype is an argument of _load
+        attrib, entries = super()._cache_state()
+        return tuple(item for item in attrib if item[0] != 'dataType'), entries
+
+    @cached
+    def _load(self, dtype: str):
+        """loads the file with the given dtype, see get_data"""
         if dtype == 'binary':
             with open(self._filename, 'rb') as f:
                 data = f.read()
@@ -837,10 +2323,9 @@ class CustomEntry(FileEntry):
             data = np.load(self._filename)
         else:
             raise ValueError('unknown dtype {}'.format(dtype))
-
-        self.dataType = dtype
         return data
 
+    @batched
     def set_data(self, data, dtype='auto', **kwargs):
         """
         Will save custom data to disk.
@@ -850,6 +2335,7 @@ class CustomEntry(FileEntry):
         :returns: the binary data or an PIL.Image
         """
         self._check_readonly()
+        self._invalidate_cache()
 
         # infer datatype automatically
         if dtype == 'auto':
@@ -934,12 +2420,17 @@ class CustomAttributes(Entry):
         self.set_attrib(entry.key, entry.value)
         self._autosave()
 
+    def _append_entry(self, entry: MiscEntry):
+        """see add_entry"""
+        assert entry._name == 'customAttribute', 'Can only add customAttribute type'
+        self.set_attrib(entry.key, entry.value)
+
 
 class MiscEntry(Entry):
     def __init__(self, name: str, key: str = None, value: str = None, **kwargs):
         """ For various smaller types of entries. The `name` describes the type and can be
         ['channel', 'context', 'customAttribute', 'group', 'groupEntry',
-        'binFileFormat', 'csvFileFormat', 'customFileFormat']"""
+        'binFileFormat', 'csvFileFormat', 'customFileFormat', 'pyramid']"""
         super().__init__(**kwargs)
         self._name = strip(name)
         if key and value:
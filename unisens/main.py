@@ -19,19 +19,108 @@ todo: channel to valuesentry
 todo: parent in folder/parent
 @author: skjerns
 """
+import io
 import os
+import time
+import atexit
+import weakref
+import shutil
 import logging
 import datetime
 import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from xml.etree import ElementTree as ET
 from xml.etree.ElementTree import Element
+
+import numpy as np
+
 from .entry import Entry, FileEntry, ValuesEntry, SignalEntry, MiscEntry
 from .entry import EventEntry, CustomEntry, CustomAttributes
-from .utils import AttrDict, strip, make_key, indent
-from .utils import str2num
+from .utils import AttrDict, LRUCache, strip, make_key, indent
+from .utils import str2num, str2num_cached, write_atomic
 
 logger = logging.getLogger("unisens")
 
+# the classes of the entry types of the unisens.xml
+_entry_types = {'customAttributes': CustomAttributes,
+                'eventEntry': EventEntry,
+                'signalEntry': SignalEntry,
+                'valuesEntry': ValuesEntry,
+                'customEntry': CustomEntry}
+
+# known entry types that are read as MiscEntry
+_misc_types = ('context', 'group', 'customAttribute', 'csvFileFormat', 'channel',
+               'binFileFormat', 'customFileFormat', 'groupEntry', 'pyramid')
+
+
+def _flush_at_exit(ref: weakref.ref):
+    """saves the pending changes of a Unisens object when Python exits"""
+    u = ref()
+    if u is None:
+        return
+    try:
+        u.flush()
+    except Exception as e:
+        logger.error(f'Can\'t save pending changes of {u._file}: {e}')
+
+
+def _last_time(entry: Entry) -> float:
+    """the time of the last sample of a SignalEntry or ValuesEntry in seconds"""
+    if isinstance(entry, ValuesEntry):
+        times, _ = entry._get_time_index()
+        return times[-1] / float(entry.sampleRate) if len(times) else -1
+    if entry.id.endswith('bin'):
+        n_samples = entry._n_samples()
+    else:
+        n_samples = entry._get_csv_data().shape[1]
+    return (n_samples - 1) / float(entry.sampleRate)
+
+
+class _EntryBuilder():
+    """
+    A parser target that builds the entries of a unisens.xml while
+    the XML is parsed, without creating an element tree first.
+    The entries are created with Entry._from_xml.
+    """
+
+    def __init__(self, folder: str, lazy: bool = False, convert_nums: bool = False):
+        self.folder = folder
+        self.lazy = lazy
+        self.convert_nums = convert_nums
+        self.attrib = None
+        self.entries = []
+        self._stack = []  # the entries of all elements that are not closed yet
+
+    def start(self, tag, attrib, *args):
+        attrib = dict(attrib)
+        if self.convert_nums:
+            attrib = {key: str2num_cached(value) for key, value in attrib.items()}
+        if self.attrib is None:
+            self.attrib = attrib  # the root element
+            return
+        entryType = strip(tag)
+        cls = _entry_types.get(entryType)
+        if cls is not None:
+            entry = cls._from_xml(attrib, self.folder, lazy=self.lazy)
+        else:
+            if entryType not in _misc_types and 'Entry' not in tag:
+                logger.warning('Unknown entry type: {}'.format(entryType))
+            entry = MiscEntry._from_xml(attrib, self.folder, name=entryType)
+        self._stack.append(entry)
+
+    def end(self, tag):
+        if not self._stack:
+            return  # end of the root element
+        entry = self._stack.pop()
+        if self._stack:
+            self._stack[-1]._append_entry(entry)
+        else:
+            self.entries.append(entry)
+
+    def close(self):
+        return self.attrib, self.entries
+
 
 class Unisens(Entry):
     """
@@ -50,7 +139,8 @@ class Unisens(Entry):
     def __init__(self, folder: str, makenew=False, autosave=False, readonly=False,
                  comment: str = '', duration: int = 0, measurementId: str = 'NaN',
                  timestampStart='', filename='unisens.xml',
-                 convert_nums=False):
+                 convert_nums=False, lazy=False, autosave_interval: float = 0,
+                 cache_bytes: int = 0):
         """
         Initializes a Unisens object.
         If a unisens.xml file is already present in the folder, it will load
@@ -65,6 +155,22 @@ class Unisens(Entry):
         :param readonly: Select if any files should be written or not.
         :param attrib: The attribute 
         :param convert_nums: try to convert numbers from attribs automatically
+        :param lazy: only parse the unisens.xml, without checking that the
+                     data files exist. Use validate() to check them later.
+        :param autosave_interval: with autosave, save at most once every
+                                  this many seconds. Pending changes are
+                                  written with the next change after the
+                                  interval, with flush(), at the end of
+                                  batch() or when Python exits normally.
+                                  If the process is killed or crashes,
+                                  the changes of the last interval are lost.
+        :param cache_bytes: keep up to this many bytes of loaded data in
+                            memory, such that repeated calls of get_data
+                            with the same arguments don't read the file
+                            again. Cached arrays are read-only, lists
+                            and dicts (e.g. csv rows) are returned as
+                            copies of the cached value.
+                            The default is 0, no caching.
         """
         assert not (autosave and readonly), \
             'either read-only or autosave can be enabled'
@@ -75,9 +181,18 @@ class Unisens(Entry):
 
         self.entries = AttrDict()
         self._entries = list()
+        self._lookup = None
         self._name = 'unisens'
         self._readonly = readonly
         self._convert_nums = convert_nums
+        self._lazy = lazy
+        self._autosave_interval = autosave_interval
+        self._batch_depth = 0
+        self._dirty = False
+        self._last_autosave = 0
+        self._cache = LRUCache(cache_bytes)
+        if autosave and autosave_interval:
+            atexit.register(_flush_at_exit, weakref.ref(self))
 
         if os.path.isfile(self._file) and not makenew:
             logger.debug('loading unisens.xml from {}'.format(self._file))
@@ -130,8 +245,47 @@ class Unisens(Entry):
         return s
 
     def _autosave(self):
-        if self.__dict__.get('_autosave_enabled', False):
+        self.__dict__['_dirty'] = True
+        if not self.__dict__.get('_autosave_enabled', False):
+            return
+        if self.__dict__.get('_batch_depth', 0) > 0:
+            return
+        interval = self.__dict__.get('_autosave_interval', 0)
+        if interval and time.monotonic() - self._last_autosave < interval:
+            return
+        self.save()
+
+    @contextmanager
+    def batch(self):
+        """
+        A context manager that collects all changes and autosaves them
+        only once at the end, instead of after every single change.
+        Batches can be nested, the XML is saved when the outermost exits.
+        If an exception is raised inside the batch, the XML is not saved,
+        such that partly applied changes are not written to disk. They
+        remain in memory and are saved with the next save or flush().
+
+        Example:
+            with u.batch():
+                for i in range(100):
+                    u.set_attrib(f'attr{i}', i)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+        if self._batch_depth == 0 and self._autosave_enabled:
+            self.flush()
+
+    def flush(self) -> Entry:
+        """
+        Save the XML if there are changes that have not been saved yet,
+        e.g. because of batch() or autosave_interval.
+        """
+        if self._dirty and not self._readonly:
             self.save()
+        return self
 
     def add_entry(self, entry: Entry, stack=None):
         """
@@ -151,6 +305,7 @@ class Unisens(Entry):
     def remove_entry(self, name: str):
         i, key = self._get_index(name)
         entry = self._entries.pop(i)
+        self._lookup = None
         for e_name, e in list(self.entries.items()):
             if e == entry:
                 del self.entries[e_name]
@@ -168,24 +323,23 @@ class Unisens(Entry):
         attrib = element.attrib.copy()
         if self._convert_nums:
             for key, value in attrib.items():
-                attrib[key] = str2num(value)
+                attrib[key] = str2num_cached(value)
 
+        lazy = self.__dict__.get('_lazy', False)
         entryType = strip(element.tag)
         if entryType == 'customAttributes':
             entry = CustomAttributes(attrib=attrib, parent=self._folder)
         elif entryType == 'eventEntry':
-            entry = EventEntry(attrib=attrib, parent=self._folder,
+            entry = EventEntry(attrib=attrib, parent=self._folder, lazy=lazy,
                                separator=';', decimalSeparator='.')
         elif entryType == 'signalEntry':
-            entry = SignalEntry(attrib=attrib, parent=self._folder)
+            entry = SignalEntry(attrib=attrib, parent=self._folder, lazy=lazy)
         elif entryType == 'valuesEntry':
-            entry = ValuesEntry(attrib=attrib, parent=self._folder,
+            entry = ValuesEntry(attrib=attrib, parent=self._folder, lazy=lazy,
                                 separator=';', decimalSeparator='.')
         elif entryType == 'customEntry':
-            entry = CustomEntry(attrib=attrib, parent=self._folder)
-        elif entryType in ('context', 'group', 'customAttribute',
-                           'csvFileFormat', 'channel', 'binFileFormat',
-                           'customFileFormat', 'groupEntry'):
+            entry = CustomEntry(attrib=attrib, parent=self._folder, lazy=lazy)
+        elif entryType in _misc_types:
             name = element.tag
             entry = MiscEntry(name=name, attrib=attrib, parent=self._folder)
         else:
@@ -199,14 +353,255 @@ class Unisens(Entry):
             entry.add_entry(subentry)
         return entry
 
-    def save(self, folder: str = None, filename: str = 'unisens.xml') -> Entry:
+    def _read_xml(self, file: str):
+        """
+        Parses a unisens.xml and builds its entries while parsing.
+        The result is the same as with unpack_element, but large headers
+        with thousands of entries are read much faster.
+        Uses the parser of lxml if it is installed, else of ElementTree.
+
+        :param file: the unisens.xml
+        :returns: the attributes of the root element and its entries
+        """
+        try:
+            from lxml.etree import XMLParser
+        except ImportError:
+            XMLParser = ET.XMLParser
+        builder = _EntryBuilder(self._folder, lazy=self.__dict__.get('_lazy', False),
+                                convert_nums=self._convert_nums)
+        parser = XMLParser(target=builder)
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                parser.feed(chunk)
+        return parser.close()
+
+    def validate(self) -> Entry:
+        """
+        Checks that the data files of all entries exist.
+
+        :raises FileNotFoundError: if a file does not exist
+        :returns: self
+        """
+        for entry in self._entries:
+            if isinstance(entry, FileEntry):
+                entry.validate()
+        return self
+
+    def cache_info(self) -> dict:
+        """
+        Statistics of the data cache, see `cache_bytes` of Unisens()
+
+        :returns: a dict with the number of hits, misses, evictions,
+                  cached items and the bytes used of max_bytes
+        """
+        return self._cache.info()
+
+    def clear_cache(self, max_bytes: int = None) -> Entry:
+        """
+        Remove all data from the cache and reset its statistics
+
+        :param max_bytes: set a new size of the cache, 0 disables it
+        """
+        self._cache.clear()
+        if max_bytes is not None:
+            self._cache.max_bytes = max_bytes
+        return self
+
+    def get_data_many(self, ids: list = None, n_workers: int = None,
+                      mode: str = None, **kwargs) -> dict:
+        """
+        Load the data of several entries at once. The files are read
+        concurrently by a pool of threads, as numpy releases the GIL
+        while reading from disk.
+
+        Example:
+            data = u.get_data_many(start=0, stop=60, unit='seconds')
+            ecg = data['ECG.bin']
+
+        :param ids: the ids of the entries to load. abbreviations are allowed.
+                    The default is all SignalEntries and ValuesEntries.
+        :param n_workers: the number of threads. The default is chosen
+                          by ThreadPoolExecutor depending on the CPU count.
+        :param mode: the mode passed to get_data of ValuesEntries and
+                     EventEntries, e.g. 'numpy' or 'pandas'
+        :param kwargs: passed to SignalEntry.get_data, e.g. scaled=False,
+                       start, stop, unit or channels
+        :returns: a dictionary with the entry ids as keys and the data as values
+        """
+        if ids is None:
+            entries = [entry for entry in self._entries
+                       if isinstance(entry, (SignalEntry, ValuesEntry))]
+        else:
+            entries = [self[id] for id in ids]
+
+        def load(entry):
+            if isinstance(entry, SignalEntry):
+                return entry.get_data(**kwargs)
+            if isinstance(entry, (ValuesEntry, EventEntry)) and mode is not None:
+                return entry.get_data(mode=mode)
+            return entry.get_data()
+
+        with ThreadPoolExecutor(max_workers=n_workers) as executor:
+            results = executor.map(load, entries)
+            return {entry.id: data for entry, data in zip(entries, results)}
+
+    def get_epochs(self, events, pre: float, post: float, signals: list = None,
+                   labels: list = None, channels=None, scaled: bool = True,
+                   dtype=np.float64, fill_value=np.nan) -> dict:
+        """
+        Cuts windows around events out of several signals, e.g. to train
+        a classifier on heart beats. The event times are converted to
+        samples with the sampleRate of each signal and only the windows
+        are read from disk (see SignalEntry.get_epochs). Samples of
+        windows that reach beyond the signal are filled with `fill_value`.
+
+        Example:
+            epochs = u.get_epochs('events.csv', pre=0.2, post=0.4,
+                                  signals=['ECG.bin'], labels=['N'])
+            ecg = epochs['ECG.bin']  # shape (n_events, n_channels, n_samples)
+
+        :param events: an EventEntry or ValuesEntry (or its id), or an
+                       array with the event times in seconds
+        :param pre: seconds before each event that are included
+        :param post: seconds after each event that are included
+        :param signals: the ids of the SignalEntries, default all SignalEntries
+        :param labels: only use events with these labels of an EventEntry
+        :param channels: channel indices and/or names, default all channels
+        :param scaled: scale values using lsbValue and baseline
+        :param dtype: the dtype of the returned arrays
+        :param fill_value: value of samples outside of the signal
+        :returns: a dictionary with the signal ids as keys and arrays of
+                  shape (n_events, n_channels, n_samples) as values.
+                  Events of an entry are sorted by time.
+        """
+        if isinstance(events, str):
+            events = self[events]
+        if isinstance(events, Entry):
+            times, data = events._get_time_index()
+            if labels is not None:
+                times = times[np.isin(data['label'], labels)]
+            times = times / float(events.sampleRate)
+        else:
+            assert labels is None, 'labels can only be used with an EventEntry'
+            times = np.asarray(events, dtype=np.float64).ravel()
+
+        if signals is None:
+            signals = [entry for entry in self._entries if isinstance(entry, SignalEntry)]
+        else:
+            signals = [self[id] if isinstance(id, str) else id for id in signals]
+
+        epochs = {}
+        for signal in signals:
+            sfreq = float(signal.sampleRate)
+            starts = np.round((times - pre) * sfreq).astype(np.int64)
+            n_samples = int(round((pre + post) * sfreq))
+            epochs[signal.id] = signal.get_epochs(starts, n_samples, channels=channels,
+                                                  scaled=scaled, dtype=dtype,
+                                                  fill_value=fill_value)
+        return epochs
+
+    def iter_aligned(self, ids: list = None, sampleRate: float = None,
+                     master=None, start: float = None, stop: float = None,
+                     method: str = 'linear', chunksize: int = 2**16):
+        """
+        Resamples several entries with different sample rates to the same
+        sample rate and yields them chunk by chunk, such that long
+        recordings can be processed without loading them completely.
+        The samples are aligned at the start of the recording, i.e.
+        sample k of every entry is at k / sampleRate seconds.
+
+        Example:
+            for chunk in u.iter_aligned(['ECG.bin', 'acc.bin'], sampleRate=64):
+                features = compute(chunk.times, chunk.data['ECG.bin'])
+
+        :param ids: the ids of SignalEntries and ValuesEntries.
+                    The default is all SignalEntries and ValuesEntries.
+        :param sampleRate: the sample rate all entries are resampled to
+        :param master: an entry (or its id) whose sampleRate is used,
+                       start and stop default to its first and last sample
+        :param start: the first second, default the start of the recording
+        :param stop: the last second (exclusive), default the end of the
+                     longest entry
+        :param method: 'linear' interpolation or 'polyphase' filtering of
+                       SignalEntries (needs scipy), which avoids aliasing
+                       when reducing the rate. ValuesEntries are always
+                       interpolated linearly.
+        :param chunksize: the number of resampled samples per chunk
+        :returns: a generator of AttrDicts with the `times` in seconds and
+                  `data`, a dictionary with the entry ids as keys and
+                  arrays of shape (n_channels, n_samples) as values.
+                  Times outside of an entry are NaN.
+        """
+        if ids is None:
+            entries = [entry for entry in self._entries
+                       if isinstance(entry, (SignalEntry, ValuesEntry))]
+        else:
+            entries = [self[id] if isinstance(id, str) else id for id in ids]
+        for entry in entries:
+            if not isinstance(entry, (SignalEntry, ValuesEntry)):
+                raise ValueError(f'{entry.id} is not a SignalEntry or ValuesEntry')
+
+        if master is not None:
+            master = self[master] if isinstance(master, str) else master
+            sampleRate = float(master.sampleRate)
+            entries_end = [master]
+        else:
+            entries_end = entries
+        assert sampleRate is not None, 'Please specify sampleRate or master'
+        sampleRate = float(sampleRate)
+
+        k0 = 0 if start is None else int(np.ceil(start * sampleRate))
+        if stop is None:
+            stop = max([_last_time(entry) for entry in entries_end], default=-1)
+            k1 = int(np.floor(stop * sampleRate)) + 1
+        else:
+            k1 = int(np.ceil(stop * sampleRate))
+        for i in range(k0, k1, chunksize):
+            j = min(i + chunksize, k1)
+            data = {entry.id: entry._resample(i, j, sampleRate, method=method)
+                    for entry in entries}
+            yield AttrDict(times=np.arange(i, j) / sampleRate, data=data)
+
+    def get_aligned(self, ids: list = None, sampleRate: float = None,
+                    master=None, start: float = None, stop: float = None,
+                    method: str = 'linear', chunksize: int = 2**16) -> AttrDict:
+        """
+        Resamples several entries with different sample rates to the same
+        sample rate. See iter_aligned for the parameters.
+
+        Example:
+            aligned = u.get_aligned(master='ECG.bin')
+            plt.plot(aligned.times, aligned.data['temperature.csv'][0])
+
+        :returns: an AttrDict with the `times` in seconds and `data`, a
+                  dictionary with the entry ids as keys and arrays of
+                  shape (n_channels, n_samples) as values
+        """
+        chunks = list(self.iter_aligned(ids, sampleRate=sampleRate, master=master,
+                                        start=start, stop=stop, method=method,
+                                        chunksize=chunksize))
+        if not chunks:
+            return AttrDict(times=np.array([]), data={})
+        data = {id: np.concatenate([chunk.data[id] for chunk in chunks], axis=1)
+                for id in chunks[0].data}
+        return AttrDict(times=np.concatenate([chunk.times for chunk in chunks]),
+                        data=data)
+
+    def save(self, folder: str = None, filename: str = 'unisens.xml',
+             backup: bool = False) -> Entry:
         """
         Save this Unisens xml file to a given folder and filename.
         filename should be unisens.xml, but can be altered if necessary
-        
+
+        The xml is first written to a temporary file, which then replaces
+        the existing file. Therefore the previous file stays intact if
+        the process is interrupted while saving. If nothing has changed
+        since the last save, the file is not written again.
+
         :param folder: where to save the unisens description object.
                        will overwrite existing description file.
         :param filename: the filename to save. use unisens.xml.
+        :param backup: keep a copy of the previous file as unisens.xml.bak
         """
         self._check_readonly()
 
@@ -220,10 +615,36 @@ class Unisens(Entry):
         element = self.to_element()
         indent(element)
         et = ET.ElementTree(element)
-        et.write(file, xml_declaration=True, default_namespace='',
-                 encoding='utf-8')
+        with io.BytesIO() as buffer:
+            et.write(buffer, xml_declaration=True, default_namespace='',
+                     encoding='utf-8')
+            content = buffer.getvalue()
+
+        if not self._is_saved(file, content):
+            if backup and os.path.isfile(file):
+                shutil.copy2(file, file + '.bak')
+            write_atomic(file, content)
+            stat = os.stat(file)
+            self._last_save = (os.path.abspath(file), content,
+                               stat.st_mtime_ns, stat.st_size)
+        self._dirty = False
+        self._last_autosave = time.monotonic()
         return self
 
+    def _is_saved(self, file: str, content: bytes) -> bool:
+        """
+        Check if `content` is what has been saved last to `file`
+        and the file has not been modified since then.
+        """
+        last_save = self.__dict__.get('_last_save')
+        if last_save is None or last_save[:2] != (os.path.abspath(file), content):
+            return False
+        try:
+            stat = os.stat(file)
+        except OSError:
+            return False
+        return last_save[2:] == (stat.st_mtime_ns, stat.st_size)
+
     def read_unisens(self, folder: str = None, filename='unisens.xml') -> Entry:
         """
         Loads an XML Unisens file into this Unisens object.
@@ -243,24 +664,18 @@ class Unisens(Entry):
             raise FileNotFoundError('{} does not exist'.format(file))
 
         try:
-            root = ET.parse(file).getroot()
+            attrib, entries = self._read_xml(file)
         except Exception as e:
             print('Error reading {}'.format(file))
             raise e
 
-        # copy all attributes from root to this Unisens object
-        self.attrib = root.attrib
-
-        # convert strings to numbers if that is requested
-
-        if self._convert_nums:
-            for key, value in self.attrib.items():
-                self.attrib[key] = str2num(value)
+        # copy all attributes from root to this Unisens object,
+        # strings were converted to numbers if that is requested
+        self.attrib = attrib
 
         # now add all elements that are contained in this XML object
 
-        for element in root:
-            entry = self.unpack_element(element)
+        for entry in entries:
             self.add_entry(entry)
             id = entry.attrib.get('id', entry._name)
             self.entries[id] = entry
@@ -6,8 +6,12 @@ some helper functions
 
 @author: skjerns
 """
+import os
 import re
+import threading
 import warnings
+from functools import lru_cache
+from itertools import islice
 from types import GeneratorType
 import numpy as np
 from collections import OrderedDict
@@ -85,7 +89,82 @@ def str2num(string, decimal_sep='.'):
         return string
 
 
-def write_csv(csv_file, data_list, sep=';', decimal_sep='.', comment=None):
+# attribute values repeat a lot between entries and recordings,
+# e.g. sampleRate or dataType, so their conversion is cached
+str2num_cached = lru_cache(maxsize=65536)(str2num)
+
+
+def str2num_column(column, decimal_sep='.') -> list:
+    """
+    Converts a column of strings to numbers, with the same result as
+    calling str2num on each value. The type of the column is inferred
+    once: if all values are integers, booleans or floats, the whole
+    column is converted by numpy at once. Columns with mixed values
+    fall back to converting each distinct value separately.
+
+    :param column: a list of strings, e.g. all values of a csv column
+    :param decimal_sep: the decimal separator used for floats
+    :returns: a list with the converted values
+    """
+    column = list(column)
+    if not set(map(type, column)) <= {str}:
+        return [str2num(value, decimal_sep=decimal_sep) for value in column]
+    values = np.array(column, dtype=str)
+    is_digit = np.char.isdigit(values)
+    try:
+        if is_digit.all():
+            return values.astype(np.int64).tolist()
+        is_true = values == 'True'
+        if (is_true | (values == 'False')).all():
+            return is_true.tolist()
+        # necessary because of PEP-515, ignore _ in strings
+        if not (np.char.find(values, '_') >= 0).any():
+            if decimal_sep != '.':
+                values = np.char.replace(values, decimal_sep, '.')
+            converted = values.astype(np.float64).tolist()
+            # integers stay integers, as with str2num
+            for i in np.flatnonzero(is_digit).tolist():
+                converted[i] = int(column[i])
+            return converted
+    except (ValueError, OverflowError):
+        pass
+    # mixed columns, e.g. labels, often repeat values: convert each once
+    unique = {value: str2num(value, decimal_sep=decimal_sep) for value in set(column)}
+    return list(map(unique.__getitem__, column))
+
+
+def _write_csv_array(f, data, sep=';', decimal_sep='.', chunksize=65536):
+    """
+    Writes a numeric 1D or 2D array to an opened csv file.
+
+    Whole chunks of rows are converted to strings at once, which gives
+    the same representation as calling str() on each value.
+    """
+    if data.ndim == 1:
+        data = data[:, None]
+    n_cols = data.shape[1]
+    replace_decimal = data.dtype.kind == 'f' and decimal_sep != '.'
+    for i in range(0, len(data), chunksize):
+        chunk = data[i:i + chunksize]
+        if n_cols == 0:
+            f.write('\n' * len(chunk))
+            continue
+        if data.dtype == np.float64 or data.dtype.kind in 'biu':
+            # python floats/ints have the same str() as their numpy scalars
+            values = list(map(str, chunk.ravel().tolist()))
+        else:
+            values = chunk.astype(str).ravel().tolist()
+        if replace_decimal and sep == '.':
+            values = [value.replace('.', decimal_sep) for value in values]
+        rows = zip(*[iter(values)] * n_cols)
+        lines = '\n'.join(map(sep.join, rows)) + '\n'
+        if replace_decimal and sep != '.':
+            lines = lines.replace('.', decimal_sep)
+        f.write(lines)
+
+
+def write_csv(csv_file, data_list, sep=';', decimal_sep='.', comment=None,
+              chunksize=65536):
     """
     Parameters
     ----------
@@ -100,6 +179,8 @@ def write_csv(csv_file, data_list, sep=';', decimal_sep='.', comment=None):
         the decimal separator to be used. The default is '.'.
     comment : str, optional
         a comment that will be inserted to the beginning, starting with #
+    chunksize : int, optional
+        number of lines that are converted and written at once.
         
     Returns
     -------
@@ -111,36 +192,63 @@ def write_csv(csv_file, data_list, sep=';', decimal_sep='.', comment=None):
     assert decimal_sep != sep, 'Error, sep cannot be same as decimal_sep'
     assert isinstance(data_list, (tuple, list, np.ndarray, GeneratorType)), \
         'Must be list, tuple or array'
-    if isinstance(data_list, np.ndarray):
-        if data_list.ndim == 1:
-            data_list = [line for line in data_list]
-        elif data_list.ndim == 2:
-            data_list = [[x for x in d] for d in data_list]
-        else:
-            raise ValueError('Array must be 1D or 2D')
-
-    # first add the comments if there are any
-    csv_string = ''
-    if comment is not None:
-        comment = comment.split('\n')
-        csv_string += '# ' + '\n# '.join(comment) + '\n'
-
-    # now go through the data list or array.
-    for line in data_list:
-        # if it contains several elements, we separate them with sep.
-        # additionally we convert the decimal separator
-        if isinstance(line, (list, np.ndarray, tuple)):
-            csv_string += sep.join([num2str(e, decimal_sep) for e in line])
-        # if it's not a list, we just convert to string
-        else:
-            csv_string += num2str(line, decimal_sep)
-        csv_string += '\n'
+    if isinstance(data_list, np.ndarray) and data_list.ndim not in (1, 2):
+        raise ValueError('Array must be 1D or 2D')
 
     with open(csv_file, 'w') as f:
-        f.write(csv_string)
+        # first add the comments if there are any
+        if comment is not None:
+            comment = comment.split('\n')
+            f.write('# ' + '\n# '.join(comment) + '\n')
+
+        # numeric arrays are converted column-wise by numpy
+        if isinstance(data_list, np.ndarray) and data_list.dtype.kind in 'biufU':
+            _write_csv_array(f, data_list, sep=sep, decimal_sep=decimal_sep,
+                             chunksize=chunksize)
+            return True
+
+        # now go through the data list or array.
+        lines = []
+        for line in data_list:
+            # if it contains several elements, we separate them with sep.
+            # additionally we convert the decimal separator
+            if isinstance(line, (list, np.ndarray, tuple)):
+                lines.append(sep.join([num2str(e, decimal_sep) for e in line]))
+            # if it's not a list, we just convert to string
+            else:
+                lines.append(num2str(line, decimal_sep))
+            if len(lines) >= chunksize:
+                f.write('\n'.join(lines) + '\n')
+                lines = []
+        if lines:
+            f.write('\n'.join(lines) + '\n')
     return True
 
 
+def write_atomic(file, content: bytes):
+    """
+    Write `content` to a temporary file next to `file`, sync it to
+    disk and then replace `file` with it in one step. If the process
+    is interrupted, `file` is either the old or the new version.
+
+    :param file: the file to write
+    :param content: the bytes to write into the file
+    """
+    tmp_file = os.path.join(os.path.dirname(file),
+                            f'.{os.path.basename(file)}.'
+                            f'{os.getpid()}.{threading.get_ident()}.tmp')
+    try:
+        with open(tmp_file, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_file, file)
+    except BaseException:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+
+
 def read_csv(csv_file, comment='#', sep=';', decimal_sep='.',
              convert_nums=False, keep_empty=False):
     """
@@ -174,13 +282,135 @@ def read_csv(csv_file, comment='#', sep=';', decimal_sep='.',
         for i, line in enumerate(lines):
             if line[-1] == '': lines[i] = line[:-1]
 
-    # convert to numbers if requested
-    if convert_nums:
-        lines = [[str2num(e, decimal_sep=decimal_sep) for e in line] \
-                 for line in lines]
+    # convert to numbers if requested, column by column
+    if convert_nums and lines:
+        n_cols = max(map(len, lines))
+        if all(len(line) == n_cols for line in lines):
+            columns = [str2num_column(column, decimal_sep=decimal_sep)
+                       for column in zip(*lines)]
+            lines = [list(line) for line in zip(*columns)] if n_cols else lines
+        else:
+            for i in range(n_cols):
+                column = [line[i] for line in lines if len(line) > i]
+                values = iter(str2num_column(column, decimal_sep=decimal_sep))
+                for line in lines:
+                    if len(line) > i:
+                        line[i] = next(values)
     return lines
 
 
+def _convert_column(column: np.ndarray, decimal_sep='.') -> np.ndarray:
+    """
+    Converts a column of strings to int64 or float64 if all values of
+    the column can be converted, else the column is returned as strings.
+    """
+    if len(column) == 0:
+        return column.astype(np.float64)
+    # necessary because of PEP-515, ignore _ in strings
+    if (np.char.find(column, '_') >= 0).any():
+        return np.char.strip(column)
+    try:
+        return column.astype(np.int64)
+    except (ValueError, OverflowError):
+        pass
+    try:
+        if decimal_sep != '.':
+            column = np.char.replace(column, decimal_sep, '.')
+        return column.astype(np.float64)
+    except (ValueError, OverflowError):
+        pass
+    return np.char.strip(column)
+
+
+def _split_lines(lines, sep=';', comment='#') -> np.ndarray:
+    """
+    Splits a list of csv lines into a 2D array of strings.
+    Lines starting with `comment` and empty lines are ignored.
+    """
+    text = ''.join(lines)
+    if text.startswith(comment) or ('\n' + comment) in text:
+        lines = [line for line in lines if not line.startswith(comment)]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')  # warns on chunks without data
+            return np.loadtxt(lines, dtype=str, delimiter=sep, comments=None,
+                              ndmin=2, encoding=None)
+    except ValueError:
+        # lines have a different number of columns, fill up with ''
+        rows = [line.strip().split(sep) for line in lines if line.strip()]
+        n_cols = max(map(len, rows), default=0)
+        rows = [row + [''] * (n_cols - len(row)) for row in rows]
+        return np.array(rows, dtype=str).reshape([len(rows), n_cols])
+
+
+def read_csv_structured(csv_file, names=None, dtypes=None, comment='#',
+                        sep=';', decimal_sep='.', chunksize=65536):
+    """
+    Load a csv file into a numpy structured array with one field per column.
+
+    The file is parsed in chunks of lines. The type of each column is
+    inferred once for the whole column: int64 if all values are integers,
+    float64 if all values are numbers, else the column is kept as strings.
+    Missing values of shorter lines are filled with empty strings and
+    empty last columns (e.g. from a trailing separator) are removed.
+
+    :param csv_file: a csv file to load
+    :param names: names of the fields, e.g. ['time', 'label'].
+                  Additional columns are named f2, f3, etc.
+    :param dtypes: a dict with fixed dtypes for some fields, e.g. {'label': str}
+    :param comment: lines starting with this sign will be ignored
+    :param sep: set a different separator. this is language specific
+    :param decimal_sep: the decimal separator used for floats
+    :param chunksize: number of lines that are parsed at once
+    :returns: a numpy structured array. if the file contains no data,
+              an empty array with the fields `names` is returned, which
+              are float64 unless given in `dtypes`.
+    """
+    chunks = []
+    with open(csv_file, 'r') as f:
+        while True:
+            lines = list(islice(f, chunksize))
+            if not lines:
+                break
+            chunks.append(_split_lines(lines, sep=sep, comment=comment))
+
+    n_rows = sum(len(chunk) for chunk in chunks)
+    dtypes = dtypes or {}
+    if n_rows == 0:
+        # no data, but the requested fields are kept
+        names = list(names or [])
+        names = [name if name and name not in names[:i] else f'f{i}'
+                 for i, name in enumerate(names)]
+        return np.empty(0, dtype=[(name, dtypes.get(name, np.float64))
+                                  for name in names])
+    n_cols = max([chunk.shape[1] for chunk in chunks if len(chunk)], default=0)
+    columns = []
+    for i in range(n_cols):
+        column = [chunk[:, i] if i < chunk.shape[1] else np.full(len(chunk), '')
+                  for chunk in chunks]
+        columns.append(np.concatenate(column) if column else np.array([], dtype=str))
+    # remove empty last columns, e.g. due to a trailing separator
+    while columns and len(columns[-1]) and not np.char.str_len(columns[-1]).any():
+        columns.pop()
+
+    names = list(names or [])[:len(columns)]
+    names += [f'f{i}' for i in range(len(names), len(columns))]
+    names = [name if name and name not in names[:i] else f'f{i}'
+             for i, name in enumerate(names)]
+    arrays = []
+    for name, column in zip(names, columns):
+        if name in dtypes:
+            column = np.char.strip(column).astype(dtypes[name])
+        else:
+            column = _convert_column(column, decimal_sep=decimal_sep)
+        arrays.append(column)
+
+    data = np.empty(n_rows, dtype=[(name, arr.dtype) for name, arr in zip(names, arrays)])
+    for name, arr in zip(names, arrays):
+        data[name] = arr
+    return data
+
+
 class AttrDict(OrderedDict):
     """
     A dictionary that is ordered and can be accessed 
@@ -192,6 +422,76 @@ class AttrDict(OrderedDict):
         self.__dict__ = self
 
 
+class LRUCache():
+    """
+    A thread-safe least-recently-used cache with a budget in bytes.
+    If a new item exceeds the budget, the least recently used items
+    are removed. Items that are larger than the budget are not cached.
+    Only the budget is kept when the cache is copied or pickled.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def clear(self):
+        """remove all items and reset the statistics"""
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.n_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """returns the item and marks it as recently used"""
+        with self._lock:
+            if key not in self._items:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._items.move_to_end(key)
+            return self._items[key][0]
+
+    def put(self, key, value, n_bytes: int):
+        """adds an item and removes old items if over budget"""
+        with self._lock:
+            if key in self._items:
+                self.n_bytes -= self._items.pop(key)[1]
+            if n_bytes > self.max_bytes:
+                return
+            self._items[key] = (value, n_bytes)
+            self.n_bytes += n_bytes
+            while self.n_bytes > self.max_bytes:
+                _, (_, size) = self._items.popitem(last=False)
+                self.n_bytes -= size
+                self.evictions += 1
+
+    def remove(self, condition):
+        """removes all items for which condition(key) is True"""
+        with self._lock:
+            for key in [key for key in self._items if condition(key)]:
+                self.n_bytes -= self._items.pop(key)[1]
+
+    def info(self) -> dict:
+        """statistics of the cache"""
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'items': len(self._items),
+                'n_bytes': self.n_bytes, 'max_bytes': self.max_bytes}
+
+
 def valid_filename(name: str):
     """
     Checks whether a filename follows the naming conventions
@@ -238,6 +538,8 @@ def check4(name):
             raise ValueError('ID cannot contain :*?"<>|')
 
 
+# entry ids and names repeat often, e.g. for every channel
+@lru_cache(maxsize=65536)
 def make_key(string: str):
     """
     A function that turns any string into a valid python variable string
@@ -300,3 +602,16 @@ def infer_dtype(dataType: str) -> str:
     return dataType
 
 
+def numpy_dtype(dataType: str) -> np.dtype:
+    """
+    Mapping universal / java data type to the numpy data type
+
+    :param dataType: str with universal data type, e.g. 'int16' or 'DOUBLE'
+    :return: the corresponding numpy dtype
+    """
+    dtype_mapping = {'DOUBLE': 'float64',
+                     'FLOAT': 'float32'}
+    dataType = infer_dtype(dataType)
+    return np.dtype(dtype_mapping.get(dataType, dataType.lower()))
+
+